@@ -1,128 +1,67 @@
-from flask import Flask, render_template, request, jsonify
-from pymongo import MongoClient
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, stream_with_context
 from dotenv import load_dotenv
 import os
 import re
-import certifi
+import json
 import logging
 from datetime import datetime
-import sys
+import time
+
+import metrics
+from captions import LANGUAGES, TEMPLATES, render_captions
+from catalog import Catalog
+from fetcher import ProductFetcher
+from fragments import stored_labels
+from localization import convert_url_to_language, localize_url  # convert_url_to_language kept importable from app
+from logging_setup import configure_logging
+from recorder import TrafficRecorder
+from result_cache import ResultCache, result_key
+from search import ProductSearch
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    stream=sys.stdout
-)
-
-# MongoDB setup using environment variables
-mongodb_uri = os.getenv('MONGODB_URI')
-db_name = os.getenv('DB_NAME', 'products')
-
-try:
-    # Connect to MongoDB Atlas with SSL certificate verification
-    logging.info(f"Attempting to connect to MongoDB at {mongodb_uri}")
-    client = MongoClient(mongodb_uri, tlsCAFile=certifi.where())
-    db = client[db_name]
-    # Test the connection
-    client.admin.command('ping')
-    logging.info("Successfully connected to MongoDB!")
-except Exception as e:
-    logging.error(f"Error connecting to MongoDB: {str(e)}")
-    raise
-
-# Caption templates for each language - RE-ADDED
-TEMPLATES = {
-    "en": {
-        "featured": "Featured In This Image:",
-        "also_featured": "Also Featured In This Image:",
-        "model_wears": "Model wears",
-        "model_right": "Model (right) wears",
-        "model_left": "Model (left) wears",
-        "model_middle": "Model (middle) wears",
-        "featured_top": "Featured In Top Image:",
-        "top_model": "Top Image: Model wears",
-        "talent": "[Talent name] wears",
-        "talent_right": "[Talent name] (right) wears",
-        "talent_left": "[Talent name] (left) wears",
-        "top_talent": "Top Image: [Talent name] wears"
-    },
-    "fr": {
-        "featured": "En vedette sur cette image:",
-        "also_featured": "Aussi en vedette sur cette image:",
-        "model_wears": "Le modèle porte:",
-        "model_right": "Le modèle (à droite) porte:",
-        "model_left": "Le modèle (à gauche) porte:",
-        "model_middle": "Le modèle (au centre) porte:",
-        "featured_top": "En vedette sur l'image du haut:",
-        "top_model": "Sur l'image du haut, le modèle porte:",
-        "talent": "[Talent name] porte:",
-        "talent_right": "[Talent name] (à droite) porte:",
-        "talent_left": "[Talent name] (à gauche) porte:",
-        "top_talent": "Sur l'image précédente, [Talent name] porte:"
-    },
-    "jp": {
-        "featured": "画像のアイテム：",
-        "also_featured": "画像のアイテム：",
-        "model_wears": "モデル着用アイテム：",
-        "model_right": "モデル (右) ：",
-        "model_left": "モデル (左) ：",
-        "model_middle": "モデル (中央) ：",
-        "featured_top": "冒頭の画像のアイテム：",
-        "top_model": "冒頭の画像 モデル着用アイテム：",
-        "talent": "[Talent name] 着用アイテム：",
-        "talent_right": "[Talent name] (右) ：",
-        "talent_left": "[Talent name] (左) ：",
-        "top_talent": "冒頭の画像 [Talent name] 着用アイテム："
-    },
-    "zh": {
-        "featured": "本图单品：",
-        "also_featured": "本图单品：",
-        "model_wears": "模特身着：",
-        "model_right": "模特（右）身着：",
-        "model_left": "模特（左）身着：",
-        "model_middle": "模特（中）身着：",
-        "featured_top": "顶图单品：",
-        "top_model": "顶图模特身着：",
-        "talent": "[Talent name]身着：",
-        "talent_right": "[Talent name]（右）身着：",
-        "talent_left": "[Talent name]（左）身着：",
-        "top_talent": "顶图[Talent name]身着："
-    }
-}
+# Configure logging (LOG_MODE, LOG_FORMAT, LOG_LEVEL; see logging_setup.py)
+configure_logging()
 
-def convert_url_to_language(url, target_lang):
-    """Convert English (en-us or en-ca) URL to target language URL (e.g., /fr/, /ja/, /zh/)."""
-    if target_lang == "en":
-        return url
+bp = Blueprint('captions', __name__)
 
-    # Define supported target languages
-    supported_langs = ["fr", "ja", "zh"]
-    if target_lang not in supported_langs:
-        logging.warning(f"Unsupported target language for URL conversion: {target_lang}")
-        return url # Return original URL if language not supported
+def create_app(catalog=None, result_cache=None, fetcher=None, warm_search=True):
+    """Build the Flask app.
 
-    # Use regex to replace /en-us/ or /en-ca/ with /<target_lang>/
-    new_url, count = re.subn(r'/en-(us|ca)/', f'/{target_lang}/', url)
+    No connection is opened here: each worker connects to MongoDB on its first
+    lookup. With PRELOAD_CATALOG set (use together with gunicorn --preload),
+    categories and products are loaded once in the master and shared with the
+    workers copy-on-write; otherwise, unless warm_search is False, each worker
+    starts building the search index in the background. With PRODUCT_FALLBACK
+    set, or a fetcher passed in, products missing from the catalog are fetched
+    from their pages.
+    """
+    app = Flask(__name__)
+    app.extensions['catalog'] = catalog or Catalog.from_env()
+    app.extensions['result_cache'] = result_cache or ResultCache.from_env()
+    app.extensions['search'] = ProductSearch(app.extensions['catalog'])
+    if fetcher is None and os.getenv('PRODUCT_FALLBACK', '').lower() in ('1', 'true', 'yes'):
+        fetcher = ProductFetcher.from_env(app.extensions['catalog'])
+    app.extensions['fetcher'] = fetcher
+    app.register_blueprint(bp)
 
-    if count == 0:
-        logging.warning(f"Could not find /en-us/ or /en-ca/ pattern in URL: {url}")
-        return url # Return original URL if pattern not found
+    # Opt-in capture of /generate traffic for replay.py
+    if os.getenv('RECORD_TRAFFIC', '').lower() in ('1', 'true', 'yes'):
+        TrafficRecorder.from_env().init_app(app)
 
-    # Apply French-specific path changes *after* language code change
-    if target_lang == "fr":
-        new_url = new_url.replace("/product/", "/produit/")
-        new_url = new_url.replace("/men/", "/hommes/")
-        new_url = new_url.replace("/women/", "/femmes/")
-        # Add other French specific replacements if needed
+    if os.getenv('PRELOAD_CATALOG', '').lower() in ('1', 'true', 'yes'):
+        try:
+            # The search index is built inside preload(), before the master's connection is released
+            app.extensions['catalog'].preload(app.extensions['search'].build)
+        except Exception as e:
+            logging.error("Error preloading catalog: %s", e)
+    elif warm_search:
+        app.extensions['search'].start()
+    return app
 
-    logging.info(f"Converted URL for {target_lang}: {new_url}")
-    return new_url
+def get_catalog():
+    return current_app.extensions['catalog']
 
 def extract_product_id(url):
     """Extract product ID from SSENSE URL."""
@@ -130,11 +69,116 @@ def extract_product_id(url):
     match = re.search(pattern, url)
     return match.group(1) if match else None
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html', templates=TEMPLATES)
 
-@app.route('/generate', methods=['POST'])
+def extract_product_ids(urls):
+    """Return the product IDs that can be extracted from urls, in order."""
+    return [pid for pid in map(extract_product_id, urls) if pid]
+
+def collect_products(urls, found):
+    """Match each URL with its looked-up product and build its per-language URLs.
+
+    Returns (products_data, errors) with products in the same order as urls.
+    """
+    products_data = [] # Store product info along with translated names
+    errors = []
+    for url in urls:
+        try:
+            product_id = extract_product_id(url)
+            if product_id:
+                product = found.get(product_id)
+                if product:
+                    logging.debug("Found product: %s - %s", product.get('brand'), product.get('subcategory'))
+                    # Copy so repeated URLs for the same product don't share state
+                    product = dict(product)
+                    product['original_url'] = url
+                    # Generate all language URLs (input is assumed to be the base 'en' URL)
+                    product['urls'] = localize_url(url)
+                    products_data.append(product)
+                else:
+                    logging.warning("Product ID %s not found in database", product_id)
+                    errors.append(f"Product ID {product_id} not found in database")
+            else:
+                 logging.warning("Could not extract product ID from URL: %s", url)
+                 errors.append(f"Could not extract product ID from URL: {url}")
+        except Exception as e:
+            error_msg = f"Error processing URL {url}: {str(e)}"
+            logging.error("Error processing URL %s: %s", url, e)
+            errors.append(error_msg)
+    return products_data, errors
+
+def build_captions(products_data, template_type, talent_name, category_cache):
+    """Render the caption in every language. Returns (captions, errors)."""
+    errors = []
+    try:
+        products = []
+        unlabelled = []
+        with metrics.span(metrics.CATEGORY_LOOKUP, template=template_type):
+            for product in products_data:
+                # Link labels materialized by fragments.py skip the per-language category lookups
+                labels = stored_labels(product, category_cache)
+                if labels:
+                    products.append({'labels': labels, 'urls': product['urls']})
+                else:
+                    entry = {'brand': product['brand'], 'categories': {}, 'urls': product['urls']}
+                    products.append(entry)
+                    unlabelled.append((product, entry))
+        # Get translated category names from the in-process category cache
+        for lang in LANGUAGES:
+            with metrics.span(metrics.CATEGORY_LOOKUP, lang, template_type):
+                for product, entry in unlabelled:
+                    entry['categories'][lang] = category_cache.translate(product.get('subcategory_id'), lang, product.get('subcategory', 'Unknown'))
+        with metrics.span(metrics.RENDER, template=template_type):
+            captions = render_captions(template_type, talent_name, products)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for lang, caption in captions.items():
+                logging.debug("Generated caption for %s: %s", lang, caption)
+    except Exception as e:
+        error_msg = f"Error generating captions for template {template_type}: {str(e)}"
+        logging.error("Error generating captions for template %s: %s", template_type, e)
+        errors.append(error_msg)
+        captions = {lang: "Error generating caption." for lang in LANGUAGES}
+    return captions, errors
+
+def find_products(product_cache, urls, template_type='all', fetcher=None):
+    """Look up every product referenced by urls in one batch. Returns (found, missing).
+
+    With a fetcher, products missing from the catalog are then fetched from
+    their pages in one bounded parallel pass (see fetcher.py).
+    """
+    with metrics.span(metrics.PARSE, template=template_type):
+        product_ids = extract_product_ids(urls)
+    with metrics.span(metrics.PRODUCT_LOOKUP, template=template_type):
+        found, missing = product_cache.get_many(product_ids)
+    if missing and fetcher is not None:
+        urls_by_id = {}
+        for url in urls:
+            urls_by_id.setdefault(extract_product_id(url), url)
+        with metrics.span(metrics.FALLBACK_FETCH, template=template_type):
+            fetched = fetcher.resolve({product_id: urls_by_id[product_id] for product_id in missing})
+        found.update(fetched)
+        missing = [product_id for product_id in missing if product_id not in fetched]
+    metrics.products_not_found(len(missing))
+    return found, missing
+
+def caption_response(urls, template_type, talent_name, found, category_cache):
+    """Build the /generate response body for urls from already looked-up products."""
+    with metrics.span(metrics.LOCALIZE, template=template_type):
+        products_data, errors = collect_products(urls, found)
+    if not products_data:
+        return {'error': 'No valid products found for the given URLs', 'errors': errors, 'success': False}
+
+    captions, caption_errors = build_captions(products_data, template_type, talent_name, category_cache)
+    errors.extend(caption_errors)
+    return {
+        'captions': captions,
+        'errors': errors,
+        'success': len(products_data) > 0
+    }
+
+@bp.route('/generate', methods=['POST'])
 def generate():
     try:
         data = request.json
@@ -142,139 +186,185 @@ def generate():
         template_type = data.get('template', "featured")
         talent_name = data.get('talent_name', '')
 
-        logging.info(f"Received request to generate caption for URLs: {urls} with template: {template_type}")
+        with metrics.span(metrics.TOTAL, template=template_type):
+            logging.info("Received request to generate caption for %d URLs with template: %s", len(urls), template_type)
+            logging.debug("Requested URLs: %s", urls)
 
-        if not urls:
-            logging.warning("No URLs provided")
-            return jsonify({'error': 'No URLs provided'}), 400
+            if not urls:
+                logging.warning("No URLs provided")
+                return jsonify({'error': 'No URLs provided'}), 400
 
-        products_data = [] # Store product info along with translated names
-        errors = []
+            # Identical requests against the same catalog version are served from the result cache
+            catalog = get_catalog()
+            result_cache = current_app.extensions['result_cache']
+            key = result_key(urls, template_type, talent_name, catalog.version())
+            if request.if_none_match.contains(key):
+                return Response(status=304, headers={'ETag': f'"{key}"'})
 
-        # --- Step 1: Fetch product data and generate all language URLs --- 
-        for url in urls:
-            product = None
-            try:
-                product_id = extract_product_id(url)
-                if product_id:
-                    logging.info(f"Looking up product ID: {product_id}")
-                    # Try integer first
-                    product = db.products.find_one({"product_id": int(product_id)})
-                    # If not found, try string (just in case)
-                    if not product:
-                        product = db.products.find_one({"product_id": product_id})
-
-                    if product:
-                        logging.info(f"Found product: {product.get('brand')} - {product.get('subcategory')}")
-                        product['original_url'] = url
-                        # Generate all language URLs
-                        product['urls'] = {
-                            'en': url, # Assume input is base 'en'
-                            'fr': convert_url_to_language(url, 'fr'),
-                            'jp': convert_url_to_language(url, 'ja'),
-                            'zh': convert_url_to_language(url, 'zh')
-                        }
-                        products_data.append(product)
-                    else:
-                        error_msg = f"Product ID {product_id} not found in database"
-                        logging.warning(error_msg)
-                        errors.append(error_msg)
-                else:
-                     error_msg = f"Could not extract product ID from URL: {url}"
-                     logging.warning(error_msg)
-                     errors.append(error_msg)
-            except Exception as e:
-                error_msg = f"Error processing URL {url}: {str(e)}"
-                logging.error(error_msg)
-                errors.append(error_msg)
-        
-        if not products_data:
-             return jsonify({'error': 'No valid products found for the given URLs', 'errors': errors, 'success': False})
-
-        # --- Step 2: Generate captions for each language using the fetched data --- 
-        captions = {}
-        # Map language to the NEW category field name
-        field_map = {
-            "en": "EN Category", # Updated
-            "fr": "FR Category", # Updated
-            "jp": "JP Category", # Updated
-            "zh": "ZH Category"  # Updated
-        }
-
-        for lang in ['en', 'fr', 'jp', 'zh']:
-            try:
-                template = TEMPLATES[lang][template_type]
-                # Apply talent name replacement if needed
-                if talent_name and ('talent' in template_type or 'talent' in template.lower()):
-                    if lang == 'fr': template = template.replace('[Nom du talent]', talent_name)
-                    elif lang == 'jp': template = template.replace('[タレント名]', talent_name)
-                    elif lang == 'zh': template = template.replace('[艺人姓名]', talent_name)
-                    else: template = template.replace('[Talent name]', talent_name)
-                
-                product_links = []
-                for product in products_data:
-                    # Get translated category name using subcategory_id and NEW field names
-                    translated_name = product.get('subcategory', 'Unknown') # Default fallback
-                    category_doc = None
-                    target_field = field_map.get(lang, "EN Category") # Default to NEW English field
-                    try:
-                        subcategory_id = int(product['subcategory_id'])
-                        # Query using the NEW ID field name
-                        category_doc = db.categorys.find_one({"ID": subcategory_id})
-                        if category_doc:
-                            if target_field in category_doc and category_doc[target_field]:
-                                translated_name = category_doc[target_field]
-                            elif "EN Category" in category_doc and category_doc["EN Category"]:
-                                # Fallback to NEW English field
-                                translated_name = category_doc["EN Category"]
-                                logging.warning(f"[CaptionGen] Lang '{lang}', field '{target_field}' missing for id {subcategory_id}. Using EN: '{translated_name}'")
-                            # else: keep original subcategory name as fallback
-                        else:
-                            logging.warning(f"[CaptionGen] Lang '{lang}', No category doc found for ID: {subcategory_id}. Using default: '{translated_name}'")
-                    except Exception as e:
-                         logging.error(f"[CaptionGen] Lang '{lang}', Error looking up category ID {product.get('subcategory_id')}: {e}")
-
-                    # Format the link string based on language order
-                    link_url = product['urls'].get(lang, product['original_url']) # Use specific lang URL
-                    if lang == "fr":
-                        product_links.append(f"[{translated_name} {product['brand']}]({link_url})")
-                    else: # EN, JP, ZH
-                        product_links.append(f"[{product['brand']} {translated_name}]({link_url})")
-                
-                # Combine links into the final caption string
-                if not product_links:
-                    captions[lang] = ""
-                    continue
-                    
-                if lang == "jp" or lang == "zh":
-                    captions[lang] = f"{template}{'、'.join(product_links)}。"
-                else: # EN, FR
-                    conjunction = " et " if lang == "fr" else " and "
-                    if len(product_links) == 1:
-                        captions[lang] = f"{template} {product_links[0]}."
-                    else:
-                        captions[lang] = f"{template} {', '.join(product_links[:-1])},{conjunction}{product_links[-1]}."
-                
-                logging.info(f"Generated caption for {lang}: {captions[lang]}")
-            except Exception as e:
-                error_msg = f"Error generating caption for language {lang}: {str(e)}"
-                logging.error(error_msg)
-                errors.append(error_msg)
-                captions[lang] = "Error generating caption."
-        
-        return jsonify({
-            'captions': captions,
-            'errors': errors,
-            'success': len(products_data) > 0
-        })
+            body = result_cache.get(key)
+            complete = True
+            if body is None:
+                # --- Step 1: Fetch product data --- 
+                # Extract every product ID first so the lookup is a single round trip
+                fetcher = current_app.extensions['fetcher']
+                found, missing = find_products(catalog.product_cache, urls, template_type, fetcher)
+
+                # --- Step 2: Generate captions for each language using the fetched data --- 
+                body = caption_response(urls, template_type, talent_name, found, catalog.category_cache)
+                # A product the fallback is still fetching arrives without a catalog version bump; don't pin its absence
+                complete = not (missing and fetcher is not None)
+                if complete:
+                    result_cache.set(key, body)
+
+            response = jsonify(body)
+            if complete:
+                response.set_etag(key)
+            return response
     except Exception as e:
         error_msg = f"Unexpected error in /generate route: {str(e)}"
-        logging.error(error_msg)
+        logging.error("Unexpected error in /generate route: %s", e)
         return jsonify({
             'error': error_msg,
             'success': False
         }), 500
 
+def read_batch_jobs():
+    """Yield caption jobs from a {"jobs": [...]} JSON body or an NDJSON body (one job per line).
+
+    An NDJSON line that is not valid JSON is yielded as a ValueError, so it
+    fails only its own job.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        for number, line in enumerate(request.stream, start=1):
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"Invalid JSON on line {number}: {e}")
+    else:
+        data = request.get_json(silent=True) or {}
+        yield from data.get('jobs', [])
+
+def enumerate_chunks(items, size):
+    """Yield (start_index, chunk) for successive lists of up to size items."""
+    chunk = []
+    start = 0
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield start, chunk
+            start += len(chunk)
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+def generate_batch_results(jobs, chunk_size, catalog, fetcher=None):
+    """Yield one result dict per job, resolving products in bulk per chunk of jobs."""
+    for index, chunk in enumerate_chunks(jobs, chunk_size):
+        # Dedupe product IDs across every job in the chunk and fetch them in one query
+        urls = []
+        for job in chunk:
+            urls.extend((job.get('urls') or []) if isinstance(job, dict) else [])
+        found, missing = find_products(catalog.product_cache, urls, 'batch', fetcher)
+
+        for job in chunk:
+            result = {'index': index}
+            index += 1
+            try:
+                if isinstance(job, ValueError):
+                    raise job
+                if not isinstance(job, dict):
+                    raise ValueError("Job must be a JSON object")
+                if 'id' in job:
+                    result['id'] = job['id']
+                urls = job.get('urls') or []
+                if not urls:
+                    result.update({'error': 'No URLs provided', 'success': False})
+                    yield result
+                    continue
+
+                result.update(caption_response(urls, job.get('template', "featured"), job.get('talent_name', ''), found, catalog.category_cache))
+            except Exception as e:
+                error_msg = f"Error processing batch job {result['index']}: {str(e)}"
+                logging.error("Error processing batch job %s: %s", result['index'], e)
+                result.update({'error': error_msg, 'success': False})
+            yield result
+
+@bp.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    """Caption many jobs in one request, streaming one NDJSON result line per job."""
+    chunk_size = int(os.getenv('BATCH_CHUNK_SIZE', 200))
+    catalog = get_catalog()
+    fetcher = current_app.extensions['fetcher']
+
+    def stream():
+        try:
+            for result in generate_batch_results(read_batch_jobs(), chunk_size, catalog, fetcher):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            error_msg = f"Unexpected error in /generate/batch route: {str(e)}"
+            logging.error("Unexpected error in /generate/batch route: %s", e)
+            yield json.dumps({'error': error_msg, 'success': False}) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+@bp.route('/search')
+def search():
+    """Autocomplete: products matching a product code, product ID or brand/category words."""
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    if not query:
+        return jsonify({'results': []})
+    try:
+        started = time.perf_counter()
+        results = current_app.extensions['search'].search(query, limit)
+        return jsonify({'results': results, 'took_ms': round((time.perf_counter() - started) * 1000, 3)})
+    except Exception as e:
+        error_msg = f"Unexpected error in /search route: {str(e)}"
+        logging.error("Unexpected error in /search route: %s", e)
+        return jsonify({'error': error_msg, 'results': []}), 500
+
+@bp.route('/cache/stats')
+def cache_stats():
+    catalog = get_catalog()
+    fetcher = current_app.extensions['fetcher']
+    return jsonify({
+        'products': catalog.product_cache.stats(),
+        'categories': {'version': catalog.category_cache.version},
+        'results': current_app.extensions['result_cache'].stats(),
+        'coalescing': {
+            'products': catalog.product_cache.flight.stats(),
+            'categories': catalog.category_cache.flight.stats()
+        },
+        'fallback': fetcher.stats() if fetcher is not None else None
+    })
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    if not metrics.ENABLED:
+        return jsonify({'error': 'Metrics are disabled; set METRICS_ENABLED=1'}), 404
+    body, content_type = metrics.render_metrics()
+    return Response(body, content_type=content_type)
+
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the worker is up. Never touches the database."""
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: the catalog backend can serve lookups."""
+    try:
+        get_catalog().ping()
+        return jsonify({'status': 'ready'})
+    except Exception as e:
+        logging.warning("Readiness check failed: %s", e)
+        return jsonify({'status': 'unavailable', 'error': str(e)}), 503
+
 if __name__ == '__main__':
     # Use different port for local development
     if os.getenv('FLASK_ENV') == 'development':
@@ -285,4 +375,4 @@ if __name__ == '__main__':
         port = int(os.getenv('PORT', 10000))
         debug = False
     
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    create_app().run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,235 @@
+"""Asyncio serving mode for the caption service.
+
+    uvicorn asgi:create_asgi_app --factory --host 0.0.0.0 --port 10000 --workers 2
+
+Serves the same /generate, /healthz and /readyz routes as the Flask app, using
+the same caption logic and caches (including the result cache, ETag and 304
+responses), but with an async MongoDB driver (motor): while one request waits
+on Atlas the worker keeps serving others. Product and category resolution for
+a request run concurrently. The Flask app stays the default; this is an
+alternative entry point.
+"""
+import asyncio
+import json
+import logging
+
+import metrics
+from app import caption_response, extract_product_ids
+from catalog import CATALOG_META_ID, Catalog, match_products, query_product_ids
+from result_cache import ResultCache, result_key
+from singleflight import AsyncSingleFlight
+
+
+class AsyncCatalog:
+    """Async lookups in front of a Catalog's caches.
+
+    With the mongo backend, cache misses are fetched through a lazily created
+    motor client; with the snapshot backend the (memory-mapped, non-blocking)
+    snapshot is read directly.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._client = None
+        self._string_ids_checked = False
+        self.product_flight = AsyncSingleFlight()
+        self.category_flight = AsyncSingleFlight()
+
+    @property
+    def db(self):
+        if self._client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            import certifi
+
+            logging.info("Opening async MongoDB connection pool")
+            self._client = AsyncIOMotorClient(self.catalog.mongodb_uri, tlsCAFile=certifi.where(), **self.catalog.client_options)
+        return self._client[self.catalog.db_name]
+
+    async def _fetch_products(self, product_ids):
+        if self.catalog.snapshot is not None:
+            return self.catalog.snapshot.lookup_products(product_ids)
+        if not self._string_ids_checked:
+            # Same check as schema.has_string_ids, which the sync path runs on connect
+            self._string_ids_checked = True
+            if await self.db.products.find_one({'product_id': {'$type': 'string'}}, {'_id': 1}) is not None:
+                logging.error("Some products still store product_id as a string; run `python schema.py --migrate`")
+                self.catalog.string_ids = True
+        query_ids = query_product_ids(product_ids, self.catalog.string_ids)
+        docs = await self.db.products.find({"product_id": {"$in": query_ids}}).to_list(length=None) if query_ids else []
+        return match_products(product_ids, docs)
+
+    async def get_products(self, product_ids):
+        """Async counterpart of ProductCache.get_many."""
+        cache = self.catalog.product_cache
+        keys, cached, to_fetch = cache.peek(product_ids)
+        if to_fetch:
+            # IDs another request is already fetching are awaited, not fetched again
+            cached.update(await self.product_flight.do_many(to_fetch, self._fetch_and_store))
+        return cache.resolve(keys, cached)
+
+    async def _fetch_and_store(self, product_ids):
+        return self.catalog.product_cache.store(*await self._fetch_products(product_ids))
+
+    async def ensure_categories(self):
+        """Reload the category table if it is stale, sharing one reload between concurrent requests."""
+        if self.catalog.category_cache.is_stale():
+            await self.category_flight.do('categories', self._load_categories)
+
+    async def _load_categories(self):
+        if self.catalog.snapshot is not None:
+            docs = self.catalog.snapshot.load_categories()
+        else:
+            docs = await self.db.categorys.find({}, Catalog.CATEGORY_PROJECTION).to_list(length=None)
+        self.catalog.category_cache.refresh(docs)
+
+    async def products_version(self):
+        """Async counterpart of Catalog.products_version."""
+        if self.catalog.snapshot is not None:
+            return self.catalog.snapshot.version
+        if self.catalog.products_version_due():
+            self.catalog.set_products_version(await self.db.catalog_meta.find_one({'_id': CATALOG_META_ID}))
+        return self.catalog.products_version()
+
+    async def version(self):
+        """Async counterpart of Catalog.version."""
+        products_version, _ = await asyncio.gather(self.products_version(), self.ensure_categories())
+        return f"{products_version}:{self.catalog.category_cache.digest()}"
+
+    async def ping(self):
+        if self.catalog.snapshot is None:
+            await self.db.client.admin.command('ping')
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def etag_matches(if_none_match, key):
+    """True if an If-None-Match header value names key's strong ETag (or is *)."""
+    for tag in (if_none_match or '').split(','):
+        tag = tag.strip()
+        if tag == '*' or tag == f'"{key}"':
+            return True
+    return False
+
+
+async def cached_result(result_cache, method, *args):
+    # A Redis-backed cache does network I/O; keep it off the event loop
+    if result_cache.redis is not None:
+        return await asyncio.to_thread(getattr(result_cache, method), *args)
+    return getattr(result_cache, method)(*args)
+
+
+async def generate(catalog, data, result_cache, if_none_match=None):
+    """Async /generate: same request and response shape as the Flask route.
+
+    Returns (status, body, etag); body is None for a 304.
+    """
+    try:
+        urls = data.get('urls', [])
+        template_type = data.get('template', "featured")
+        talent_name = data.get('talent_name', '')
+
+        logging.info("Received request to generate caption for %d URLs with template: %s", len(urls), template_type)
+        logging.debug("Requested URLs: %s", urls)
+
+        if not urls:
+            logging.warning("No URLs provided")
+            return 400, {'error': 'No URLs provided'}, None
+
+        with metrics.span(metrics.TOTAL, template=template_type):
+            # Identical requests against the same catalog version are served from the result cache
+            key = result_key(urls, template_type, talent_name, await catalog.version())
+            if etag_matches(if_none_match, key):
+                return 304, None, key
+
+            body = await cached_result(result_cache, 'get', key)
+            if body is None:
+                with metrics.span(metrics.PARSE, template=template_type):
+                    product_ids = extract_product_ids(urls)
+                # Products and categories resolve concurrently
+                with metrics.span(metrics.PRODUCT_LOOKUP, template=template_type):
+                    (found, missing), _ = await asyncio.gather(
+                        catalog.get_products(product_ids),
+                        catalog.ensure_categories()
+                    )
+                metrics.products_not_found(len(missing))
+                body = caption_response(urls, template_type, talent_name, found, catalog.catalog.category_cache)
+                await cached_result(result_cache, 'set', key, body)
+            return 200, body, key
+    except Exception as e:
+        error_msg = f"Unexpected error in /generate route: {str(e)}"
+        logging.error("Unexpected error in /generate route: %s", e)
+        return 500, {'error': error_msg, 'success': False}, None
+
+
+def create_asgi_app(catalog=None, result_cache=None):
+    """Build the ASGI application around a Catalog and ResultCache (from the environment by default)."""
+    async_catalog = AsyncCatalog(catalog or Catalog.from_env())
+    result_cache = result_cache or ResultCache.from_env()
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    async_catalog.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        if scope['type'] != 'http':
+            return
+
+        path, method = scope['path'], scope['method']
+        if path == '/generate' and method == 'POST':
+            try:
+                data = json.loads(await read_body(receive))
+            except ValueError:
+                await send_json(send, 400, {'error': 'Request body must be JSON', 'success': False})
+                return
+            request_headers = dict(scope.get('headers') or [])
+            if_none_match = request_headers.get(b'if-none-match', b'').decode('latin-1')
+            status, payload, etag = await generate(async_catalog, data, result_cache, if_none_match)
+            await send_json(send, status, payload, [(b'etag', f'"{etag}"'.encode())] if etag else ())
+        elif path == '/metrics' and metrics.ENABLED:
+            body, content_type = metrics.render_metrics()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type.encode())]})
+            await send({'type': 'http.response.body', 'body': body})
+        elif path == '/healthz':
+            await send_json(send, 200, {'status': 'ok'})
+        elif path == '/readyz':
+            try:
+                await async_catalog.ping()
+                await send_json(send, 200, {'status': 'ready'})
+            except Exception as e:
+                logging.warning("Readiness check failed: %s", e)
+                await send_json(send, 503, {'status': 'unavailable', 'error': str(e)})
+        else:
+            await send_json(send, 404, {'error': 'Not found'})
+
+    app.catalog = async_catalog
+    return app
+
@@ -0,0 +1,355 @@
+"""Offline benchmark for the caption pipeline.
+
+    python benchmark.py --products 1000000 --requests 500 --save bench_baseline.json
+    python benchmark.py --products 1000000 --requests 500 --compare bench_baseline.json
+
+Runs entirely in-process: products.txt is scaled up to --products synthetic
+products behind an in-memory stand-in for the MongoDB collections the app
+reads. /generate is driven through the Flask test client with 1-50 URLs per
+request and each template; the pipeline steps and the per-language helpers
+(URL localization, category translation, caption formatting) are timed on
+their own. Reports p50/p95/p99 latency, throughput and backend queries per
+request.
+"""
+from itertools import islice
+import argparse
+import json
+import logging
+import math
+import platform
+import random
+import re
+import sys
+import time
+
+from app import build_captions, collect_products, create_app, find_products
+from captions import FORMATTERS, LANGUAGES, TEMPLATES
+from catalog import Catalog, CategoryCache, CATALOG_META_ID
+from create_translations import TRANSLATIONS
+from fragments import LABELS_FIELD, product_labels
+from localization import URL_LANGUAGES, convert_url_to_language
+from result_cache import ResultCache
+from snapshot import read_jsonl
+
+# Synthetic products get IDs from here up, clear of the real ones in products.txt
+SYNTHETIC_ID_START = 30000000
+
+
+class SyntheticProducts:
+    """count products cycling through the seed products, built on demand.
+
+    With seed_labels (one caption_labels value per seed), products carry
+    materialized link labels as fragments.py would store them.
+    """
+
+    def __init__(self, seeds, count, seed_labels=None):
+        self.seeds = seeds
+        self.count = count
+        self.seed_labels = seed_labels
+
+    def get(self, product_id):
+        offset = product_id - SYNTHETIC_ID_START
+        if not 0 <= offset < self.count:
+            return None
+        seed = self.seeds[offset % len(self.seeds)]
+        doc = dict(seed)
+        doc['product_id'] = product_id
+        doc['product_code'] = f"{seed['product_code'][:3]}{offset % 1000:03d}{seed['product_code'][6:]}"
+        if self.seed_labels:
+            doc[LABELS_FIELD] = self.seed_labels[offset % len(self.seeds)]
+        return doc
+
+    def ids(self):
+        return range(SYNTHETIC_ID_START, SYNTHETIC_ID_START + self.count)
+
+
+class MemoryCollection:
+    """The subset of pymongo's Collection API the catalog uses, over a dict or SyntheticProducts."""
+
+    def __init__(self, store, key='product_id'):
+        self.store = store
+        self.key = key
+        self.queries = 0
+
+    def _docs(self, query):
+        value = query.get(self.key, query.get('_id'))
+        if isinstance(value, dict) and '$in' in value:
+            docs = (self.store.get(item) for item in value['$in'] if isinstance(item, int))
+            return [doc for doc in docs if doc]
+        if value is not None:
+            doc = self.store.get(value)
+            return [doc] if doc else []
+        ids = self.store.ids() if isinstance(self.store, SyntheticProducts) else self.store
+        return (self.store.get(item) for item in ids)
+
+    def find(self, query=None, projection=None):
+        self.queries += 1
+        return MemoryCursor(self._docs(query or {}))
+
+    def find_one(self, query=None, projection=None):
+        self.queries += 1
+        return next(iter(self._docs(query or {})), None)
+
+    def create_index(self, *args, **kwargs):
+        return 'memory'
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.store.setdefault(query['_id'], {'_id': query['_id']})
+        for field, amount in update.get('$inc', {}).items():
+            doc[field] = doc.get(field, 0) + amount
+
+
+class MemoryCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def limit(self, count):
+        return MemoryCursor(islice(self.docs, count) if count else self.docs)
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class MemoryDatabase:
+    def __init__(self, products, categories):
+        self.products = MemoryCollection(products)
+        self.categorys = MemoryCollection(categories, key='ID')
+        self.catalog_meta = MemoryCollection({CATALOG_META_ID: {'_id': CATALOG_META_ID, 'version': 1}})
+        self.client = self
+        self.admin = self
+
+    def __getitem__(self, name):
+        return self
+
+    def command(self, name):
+        return {'ok': 1}
+
+    def close(self):
+        pass
+
+    def queries(self):
+        return self.products.queries + self.categorys.queries + self.catalog_meta.queries
+
+
+class MemoryCatalog(Catalog):
+    """Catalog whose "MongoDB client" is a MemoryDatabase."""
+
+    def __init__(self, database, **kwargs):
+        super().__init__(backend='mongo', **kwargs)
+        self.database = database
+
+    def _connect(self, pid):
+        self._client = self.database
+        self._client_pid = pid
+
+
+def load_seed_products(path):
+    seeds = []
+    for product in read_jsonl(path):
+        product['subcategory_id'] = int(product['subcategory_id'])
+        seeds.append(product)
+    return seeds
+
+
+def build_categories(seeds):
+    """Category docs for the seed subcategories, translated where create_translations.py knows the name."""
+    translations = {entry['subcategory_en']: entry['translations'] for entry in TRANSLATIONS}
+    categories = {}
+    for seed in seeds:
+        names = translations.get(seed['subcategory'], {})
+        categories[seed['subcategory_id']] = {
+            'ID': seed['subcategory_id'],
+            'EN Category': seed['subcategory'],
+            'FR Category': names.get('fr', ''),
+            'JP Category': names.get('jp', ''),
+            'ZH Category': names.get('zh', '')
+        }
+    return categories
+
+
+def product_url(product):
+    gender = 'men' if product['product_code'][6] == 'M' else 'women'
+    slug = re.sub(r'[^a-z0-9]+', '-', product['brand'].lower()).strip('-')
+    locale = 'en-ca' if product['product_id'] % 5 == 0 else 'en-us'
+    return f"https://www.ssense.com/{locale}/{gender}/product/{slug}/{product['subcategory'].lower().replace(' ', '-')}/{product['product_id']}"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name, durations, queries=None):
+    durations = sorted(durations)
+    total = sum(durations)
+    result = {
+        'name': name,
+        'calls': len(durations),
+        'p50_ms': percentile(durations, 0.50) * 1000,
+        'p95_ms': percentile(durations, 0.95) * 1000,
+        'p99_ms': percentile(durations, 0.99) * 1000,
+        'throughput_per_s': len(durations) / max(total, 1e-9)
+    }
+    if queries is not None:
+        result['queries_per_call'] = queries / max(len(durations), 1)
+    return result
+
+
+def timed(calls):
+    """Run each zero-argument callable in calls, returning their durations."""
+    durations = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def bench_generate(client, database, products, url_counts, templates, requests, rng):
+    results = []
+    for url_count in url_counts:
+        for template in templates:
+            payloads = []
+            for _ in range(requests):
+                urls = [product_url(products.get(rng.choice(products.ids()))) for _ in range(url_count)]
+                payloads.append({'urls': urls, 'template': template, 'talent_name': 'Talent'})
+
+            def post(payload):
+                response = client.post('/generate', json=payload)
+                if response.status_code != 200:
+                    raise RuntimeError(f"/generate returned {response.status_code}: {response.get_data(as_text=True)}")
+
+            queries_before = database.queries()
+            durations = timed(lambda payload=payload: post(payload) for payload in payloads)
+            results.append(summarize(f"generate urls={url_count} template={template}", durations, database.queries() - queries_before))
+    return results
+
+
+def bench_functions(catalog, products, url_counts, requests, rng):
+    results = []
+    for url_count in url_counts:
+        batches = []
+        for _ in range(requests):
+            batches.append([product_url(products.get(rng.choice(products.ids()))) for _ in range(url_count)])
+
+        found_batches = []
+        def lookup(urls):
+            found_batches.append(find_products(catalog.product_cache, urls)[0])
+        durations = timed(lambda urls=urls: lookup(urls) for urls in batches)
+        results.append(summarize(f"find_products urls={url_count}", durations))
+
+        collected = []
+        durations = timed(lambda urls=urls, found=found: collected.append(collect_products(urls, found)[0])
+                          for urls, found in zip(batches, found_batches))
+        results.append(summarize(f"collect_products urls={url_count}", durations))
+
+        durations = timed(lambda products_data=products_data: build_captions(products_data, 'featured', 'Talent', catalog.category_cache)
+                          for products_data in collected)
+        results.append(summarize(f"build_captions urls={url_count}", durations))
+
+        for lang in LANGUAGES:
+            formatter = FORMATTERS['featured'][lang]
+            # URLs use the locale segment (ja), not the caption language (jp)
+            url_lang = URL_LANGUAGES[lang]
+            durations = timed(lambda urls=urls: [convert_url_to_language(url, url_lang) for url in urls] for urls in batches)
+            results.append(summarize(f"localize lang={lang} urls={url_count}", durations))
+            durations = timed(lambda products_data=products_data: [catalog.category_cache.translate(product['subcategory_id'], lang, product['subcategory'])
+                                                                   for product in products_data] for products_data in collected)
+            results.append(summarize(f"translate_categories lang={lang} urls={url_count}", durations))
+            durations = timed(lambda products_data=products_data: formatter.join(formatter.heading('Talent'), [
+                formatter.link(product['brand'], product['subcategory'], product['urls'][lang]) for product in products_data
+            ]) for products_data in collected)
+            results.append(summarize(f"format_caption lang={lang} urls={url_count}", durations))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print p95 changes against a baseline; return the names that regressed by more than threshold."""
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    print(f"\n{'benchmark':<52} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for result in results:
+        before = previous.get(result['name'])
+        if not before:
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / max(before['p95_ms'], 1e-9)
+        flag = ''
+        if change > threshold:
+            regressions.append(result['name'])
+            flag = '  REGRESSION'
+        print(f"{result['name']:<52} {before['p95_ms']:>9.3f}ms {result['p95_ms']:>9.3f}ms {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the caption pipeline against an in-memory catalog")
+    parser.add_argument('--seed-file', default='products.txt', help="JSONL products the synthetic catalog is built from")
+    parser.add_argument('--products', type=int, default=1000000, help="Synthetic catalog size")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per URL count and template")
+    parser.add_argument('--url-counts', default='1,5,10,25,50', help="Comma-separated URLs per request")
+    parser.add_argument('--templates', default=','.join(TEMPLATES['en']), help="Comma-separated templates")
+    parser.add_argument('--scenario', choices=['all', 'generate', 'functions'], default='all')
+    parser.add_argument('--labels', action='store_true', help="Give products materialized caption labels (see fragments.py)")
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--save', help="Write results as JSON to this path")
+    parser.add_argument('--compare', help="Baseline JSON to compare p95 latencies against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="p95 slowdown that counts as a regression")
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's logging on")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    seeds = load_seed_products(args.seed_file)
+    categories = build_categories(seeds)
+    seed_labels = None
+    if args.labels:
+        label_cache = CategoryCache(lambda: categories.values(), ttl=None)
+        seed_labels = [product_labels(seed, label_cache) for seed in seeds]
+    products = SyntheticProducts(seeds, args.products, seed_labels)
+    database = MemoryDatabase(products, categories)
+    catalog = MemoryCatalog(database)
+    url_counts = [int(count) for count in args.url_counts.split(',')]
+    templates = args.templates.split(',')
+    rng = random.Random(args.random_seed)
+
+    print(f"Catalog: {args.products} synthetic products from {len(seeds)} seeds in {args.seed_file}"
+          f"{' with caption labels' if args.labels else ''}")
+    results = []
+    if args.scenario in ('all', 'generate'):
+        client = create_app(catalog=catalog, result_cache=ResultCache(), warm_search=False).test_client()
+        results += bench_generate(client, database, products, url_counts, templates, args.requests, rng)
+    if args.scenario in ('all', 'functions'):
+        results += bench_functions(catalog, products, url_counts, args.requests, rng)
+
+    print(f"\n{'benchmark':<52} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>10} {'queries':>8}")
+    for result in results:
+        queries = f"{result['queries_per_call']:.2f}" if 'queries_per_call' in result else '-'
+        print(f"{result['name']:<52} {result['p50_ms']:>7.3f}ms {result['p95_ms']:>7.3f}ms {result['p99_ms']:>7.3f}ms "
+              f"{result['throughput_per_s']:>10.1f} {queries:>8}")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'products': args.products,
+        'requests': args.requests,
+        'results': results
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Caption a spreadsheet of images offline, without running the web app.
+
+    python caption_batch.py lookbook.csv --output lookbook_captions.csv --workers 4
+    python caption_batch.py lookbook.csv --output lookbook_captions.csv --workers 4 --resume
+
+Input is CSV (columns image_id, urls, template, talent_name; several URLs in
+one cell are separated by spaces, newlines, commas, semicolons or |) or JSONL
+(one object per line with the same keys, urls as a list or a string). Every
+product the pending rows reference is looked up in bulk up front, together
+with the category table, using the same catalog settings as the app
+(MONGODB_URI or CATALOG_BACKEND=snapshot). Rows are then captioned across a
+process pool and written, in input order, as CSV (one column per language)
+or JSONL depending on the output file's extension. Output is flushed after
+every chunk; --resume skips rows whose image_id is already in the output.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
+import csv
+import json
+import os
+import re
+import time
+
+from app import caption_response, find_products
+from captions import LANGUAGES
+from catalog import Catalog, CategoryCache
+
+URL_SEPARATORS = re.compile(r'[\s,;|]+')
+CSV_COLUMNS = ['image_id', 'template', 'talent_name', 'success'] + LANGUAGES + ['errors']
+
+# Set in each worker process by init_worker
+_found = None
+_category_cache = None
+
+
+def split_urls(value):
+    if isinstance(value, list):
+        return [url.strip() for url in value if isinstance(url, str) and url.strip()]
+    return [url for url in URL_SEPARATORS.split(value or '') if url]
+
+
+def read_rows(path):
+    """Yield caption rows ({'image_id', 'urls', 'template', 'talent_name'}) from a CSV or JSONL file."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        if path.lower().endswith(('.jsonl', '.ndjson', '.json')):
+            records = (json.loads(line) for line in file if line.strip())
+        else:
+            records = csv.DictReader(file)
+        for number, record in enumerate(records, start=1):
+            image_id = record.get('image_id') or record.get('id')
+            yield {
+                'image_id': str(image_id).strip() if image_id not in (None, '') else f"row-{number}",
+                'urls': split_urls(record.get('urls')),
+                'template': (record.get('template') or '').strip() or "featured",
+                'talent_name': (record.get('talent_name') or '').strip()
+            }
+
+
+def completed_ids(path):
+    """image_ids already written to an existing output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if path.lower().endswith('.csv'):
+            for record in csv.DictReader(file):
+                # A row cut short by an interrupted run has no errors column; caption it again
+                if record.get('errors') is not None:
+                    done.add(record['image_id'])
+        else:
+            for line in file:
+                try:
+                    done.add(json.loads(line)['image_id'])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+
+def resolve_products(catalog, rows, chunk_size=1000):
+    """Look up every product the rows reference, chunk_size IDs per query. Returns {product_id: doc}."""
+    found = {}
+    urls = [url for row in rows for url in row['urls']]
+    for start in range(0, len(urls), chunk_size):
+        chunk_found, _ = find_products(catalog.product_cache, urls[start:start + chunk_size], 'batch')
+        found.update(chunk_found)
+    return found
+
+
+def init_worker(found, category_docs):
+    global _found, _category_cache
+    _found = found
+    _category_cache = CategoryCache(lambda: (), ttl=None)
+    _category_cache.refresh(category_docs)
+
+
+def caption_rows(rows):
+    """Caption a chunk of rows with the products and categories loaded by init_worker."""
+    results = []
+    for row in rows:
+        result = {'image_id': row['image_id'], 'template': row['template'], 'talent_name': row['talent_name']}
+        if not row['urls']:
+            result.update({'error': 'No URLs provided', 'errors': ['No URLs provided'], 'success': False})
+        else:
+            try:
+                result.update(caption_response(row['urls'], row['template'], row['talent_name'], _found, _category_cache))
+            except Exception as e:
+                error_msg = f"Error captioning {row['image_id']}: {str(e)}"
+                result.update({'error': error_msg, 'errors': [error_msg], 'success': False})
+        results.append(result)
+    return results
+
+
+def iter_results(rows, found, category_docs, chunk_size=50, workers=1):
+    """Yield caption result chunks in input order, rendering across a process pool when workers > 1."""
+    chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+    if workers <= 1:
+        init_worker(found, category_docs)
+        for chunk in chunks:
+            yield caption_rows(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(found, category_docs)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(caption_rows, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ResultWriter:
+    """Appends results to a CSV or JSONL file, flushing after every chunk."""
+
+    def __init__(self, path, append):
+        self.csv = path.lower().endswith('.csv')
+        new_file = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_COLUMNS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, results):
+        for result in results:
+            if self.csv:
+                row = {column: result.get(column, '') for column in CSV_COLUMNS}
+                row.update({lang: result.get('captions', {}).get(lang, '') for lang in LANGUAGES})
+                row['errors'] = ' | '.join(result.get('errors') or [])
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate captions for a CSV or JSONL batch of images.")
+    parser.add_argument('input', help="CSV or JSONL file of image_id, urls, template, talent_name rows")
+    parser.add_argument('--output', help="CSV or JSONL output file (default: <input>_captions.jsonl)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="rendering processes")
+    parser.add_argument('--chunk-size', type=int, default=50, help="rows per worker task and per progress update")
+    parser.add_argument('--lookup-chunk', type=int, default=1000, help="URLs per product lookup query")
+    parser.add_argument('--resume', action='store_true', help="skip rows already in the output file and append")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}_captions.jsonl"
+    rows = list(read_rows(args.input))
+    done = completed_ids(output) if args.resume else set()
+    pending = [row for row in rows if row['image_id'] not in done]
+    print(f"{len(rows)} rows in {args.input}: {len(rows) - len(pending)} already captioned, {len(pending)} to go")
+    if not pending:
+        return
+
+    started = time.monotonic()
+    catalog = Catalog.from_env()
+    try:
+        found = resolve_products(catalog, pending, args.lookup_chunk)
+        category_docs = list(catalog.category_cache.loader())
+    finally:
+        # Workers only need the resolved data; don't hand them a connection
+        catalog.close()
+    print(f"Resolved {len(found)} products and {len(category_docs)} categories in {time.monotonic() - started:.1f}s")
+
+    writer = ResultWriter(output, append=args.resume)
+    captioned = failed = 0
+    try:
+        for results in iter_results(pending, found, category_docs, args.chunk_size, args.workers):
+            writer.write(results)
+            captioned += len(results)
+            failed += sum(1 for result in results if not result.get('success'))
+            elapsed = time.monotonic() - started
+            print(f"Captioned {captioned}/{len(pending)} rows ({captioned / max(elapsed, 1e-6):.0f}/s), {failed} failed")
+    finally:
+        writer.close()
+    print(f"Wrote captions to {output}")
+
+
+if __name__ == '__main__':
+    main()
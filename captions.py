@@ -0,0 +1,156 @@
+"""Caption rendering, independent of Flask and the database.
+
+Each (language, template) pair is compiled once at import into a
+CaptionFormatter, so rendering a caption is a single pass over the products.
+"""
+
+LANGUAGES = ['en', 'fr', 'jp', 'zh']
+
+# Caption templates for each language
+TEMPLATES = {
+    "en": {
+        "featured": "Featured In This Image:",
+        "also_featured": "Also Featured In This Image:",
+        "model_wears": "Model wears",
+        "model_right": "Model (right) wears",
+        "model_left": "Model (left) wears",
+        "model_middle": "Model (middle) wears",
+        "featured_top": "Featured In Top Image:",
+        "top_model": "Top Image: Model wears",
+        "talent": "[Talent name] wears",
+        "talent_right": "[Talent name] (right) wears",
+        "talent_left": "[Talent name] (left) wears",
+        "top_talent": "Top Image: [Talent name] wears"
+    },
+    "fr": {
+        "featured": "En vedette sur cette image:",
+        "also_featured": "Aussi en vedette sur cette image:",
+        "model_wears": "Le modèle porte:",
+        "model_right": "Le modèle (à droite) porte:",
+        "model_left": "Le modèle (à gauche) porte:",
+        "model_middle": "Le modèle (au centre) porte:",
+        "featured_top": "En vedette sur l'image du haut:",
+        "top_model": "Sur l'image du haut, le modèle porte:",
+        "talent": "[Talent name] porte:",
+        "talent_right": "[Talent name] (à droite) porte:",
+        "talent_left": "[Talent name] (à gauche) porte:",
+        "top_talent": "Sur l'image précédente, [Talent name] porte:"
+    },
+    "jp": {
+        "featured": "画像のアイテム：",
+        "also_featured": "画像のアイテム：",
+        "model_wears": "モデル着用アイテム：",
+        "model_right": "モデル (右) ：",
+        "model_left": "モデル (左) ：",
+        "model_middle": "モデル (中央) ：",
+        "featured_top": "冒頭の画像のアイテム：",
+        "top_model": "冒頭の画像 モデル着用アイテム：",
+        "talent": "[Talent name] 着用アイテム：",
+        "talent_right": "[Talent name] (右) ：",
+        "talent_left": "[Talent name] (左) ：",
+        "top_talent": "冒頭の画像 [Talent name] 着用アイテム："
+    },
+    "zh": {
+        "featured": "本图单品：",
+        "also_featured": "本图单品：",
+        "model_wears": "模特身着：",
+        "model_right": "模特（右）身着：",
+        "model_left": "模特（左）身着：",
+        "model_middle": "模特（中）身着：",
+        "featured_top": "顶图单品：",
+        "top_model": "顶图模特身着：",
+        "talent": "[Talent name]身着：",
+        "talent_right": "[Talent name]（右）身着：",
+        "talent_left": "[Talent name]（左）身着：",
+        "top_talent": "顶图[Talent name]身着："
+    }
+}
+
+
+# Talent placeholders the templates may use, per language
+TALENT_PLACEHOLDERS = {
+    "en": ["[Talent name]"],
+    "fr": ["[Talent name]", "[Nom du talent]"],
+    "jp": ["[Talent name]", "[タレント名]"],
+    "zh": ["[Talent name]", "[艺人姓名]"]
+}
+
+
+def link_label(lang, brand, category):
+    """Text of a product's link: brand then category, except FR which puts the category first."""
+    if lang == "fr":
+        return f"{category} {brand}"
+    return f"{brand} {category}"
+
+
+class CaptionFormatter:
+    """Pre-compiled caption layout for one language and template."""
+
+    def __init__(self, lang, template_type, template):
+        self.lang = lang
+        self.template_type = template_type
+        self.template = template
+        # JP/ZH join with 、 and end with 。; EN/FR use a comma list with a conjunction
+        self.cjk = lang in ("jp", "zh")
+        self.conjunction = " et " if lang == "fr" else " and "
+
+        self.talent_parts = None
+        for placeholder in TALENT_PLACEHOLDERS.get(lang, []):
+            if placeholder in template:
+                self.talent_parts = template.split(placeholder)
+                break
+
+    def heading(self, talent_name=''):
+        """Return the template text with the talent name filled in, if any."""
+        if talent_name and self.talent_parts:
+            return talent_name.join(self.talent_parts)
+        return self.template
+
+    def link(self, brand, category, url):
+        """Format one product as a markdown link."""
+        return f"[{link_label(self.lang, brand, category)}]({url})"
+
+    def label_link(self, label, url):
+        """Format one product as a markdown link from its pre-rendered label."""
+        return f"[{label}]({url})"
+
+    def join(self, heading, links):
+        """Combine the heading and product links into the final caption."""
+        if not links:
+            return ""
+        if self.cjk:
+            return f"{heading}{'、'.join(links)}。"
+        if len(links) == 1:
+            return f"{heading} {links[0]}."
+        return f"{heading} {', '.join(links[:-1])},{self.conjunction}{links[-1]}."
+
+
+# Every (language, template) formatter, compiled once at import
+FORMATTERS = {
+    template_type: {lang: CaptionFormatter(lang, template_type, TEMPLATES[lang][template_type]) for lang in LANGUAGES}
+    for template_type in TEMPLATES["en"]
+}
+
+
+def render_captions(template_type, talent_name, products):
+    """Render the caption for template_type in every language.
+
+    Each product is a dict with 'urls' ({lang: url}) and either 'labels'
+    ({lang: pre-rendered link label}) or 'brand' and 'categories'
+    ({lang: name}). Raises KeyError for an unknown template_type.
+    Returns {lang: caption}.
+    """
+    formatters = FORMATTERS[template_type]
+    links = {lang: [] for lang in LANGUAGES}
+    for product in products:
+        labels = product.get('labels')
+        for lang in LANGUAGES:
+            if labels:
+                links[lang].append(formatters[lang].label_link(labels[lang], product['urls'][lang]))
+            else:
+                links[lang].append(formatters[lang].link(product['brand'], product['categories'][lang], product['urls'][lang]))
+
+    return {
+        lang: formatters[lang].join(formatters[lang].heading(talent_name), links[lang])
+        for lang in LANGUAGES
+    }
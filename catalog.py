@@ -0,0 +1,645 @@
+"""Catalog lookups shared by the caption endpoints."""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+import metrics
+from singleflight import SingleFlight
+
+
+def lookup_products(collection, product_ids, string_ids=False):
+    """Fetch all products for product_ids in a single $in query.
+
+    IDs may be passed as strings or ints; product_id is stored as an int (see
+    schema.py), so IDs that are not numeric or too large for a BSON int are
+    reported missing without a query. With string_ids the string form is
+    queried as well, for databases not yet migrated by schema.py. Returns
+    (found, missing) where found maps each ID (as a string, in input order)
+    to its document and missing lists the IDs that were not found, also in
+    input order.
+    """
+    ordered_ids = list(dict.fromkeys(str(product_id) for product_id in product_ids))
+    query_ids = query_product_ids(ordered_ids, string_ids)
+
+    docs = collection.find({"product_id": {"$in": query_ids}}) if query_ids else []
+    found, missing = match_products(ordered_ids, docs)
+
+    logging.info("Looked up %d product IDs: %d found, %d missing", len(ordered_ids), len(found), len(missing))
+    return found, missing
+
+
+# BSON stores ints in at most 8 bytes; larger IDs cannot be queried and are reported missing
+MAX_PRODUCT_ID = 2 ** 63 - 1
+
+
+def query_product_ids(keys, string_ids=False):
+    """The string IDs in keys that can be queried, as ints (followed by the strings themselves with string_ids)."""
+    query_ids = []
+    for key in keys:
+        if key.isdecimal() and int(key) <= MAX_PRODUCT_ID:
+            query_ids.append(int(key))
+    if string_ids:
+        query_ids += [str(query_id) for query_id in query_ids]
+    return query_ids
+
+
+def match_products(product_ids, docs):
+    """Pair fetched docs with product_ids. Returns (found, missing) in product_ids order."""
+    docs_by_id = {str(doc.get('product_id')): doc for doc in docs}
+    found = {}
+    missing = []
+    for key in dict.fromkeys(str(product_id) for product_id in product_ids):
+        if key in docs_by_id:
+            found[key] = docs_by_id[key]
+        else:
+            missing.append(key)
+    return found, missing
+
+
+# Category translation field for each caption language
+CATEGORY_FIELDS = {
+    "en": "EN Category",
+    "fr": "FR Category",
+    "jp": "JP Category",
+    "zh": "ZH Category"
+}
+
+
+def category_key(name):
+    """Normalize a category name for matching: "BELTS & SUSPENDERS" and the URL slug "belts-suspenders" agree."""
+    return '-'.join(re.findall(r'[0-9a-z]+', str(name or '').lower()))
+
+
+class CategoryCache:
+    """In-process copy of the categorys collection, keyed by category ID.
+
+    loader is called with no arguments and must return an iterable of category
+    documents. The table is loaded on first use and reloaded once it is older
+    than ttl seconds (ttl=None never expires); invalidate() forces a reload on
+    the next lookup.
+    """
+
+    def __init__(self, loader, ttl=3600):
+        self.loader = loader
+        self.ttl = ttl
+        self.version = 0
+        self._digest = None
+        self._row_versions = {}
+        self._ids_by_name = {}
+        self._categories = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+
+    def is_stale(self):
+        """True if the table has not been loaded yet or is older than the TTL."""
+        if self._categories is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+
+    def _table(self):
+        categories = self._categories
+        if self.is_stale():
+            # Concurrent requests that find the table stale share one reload
+            categories = self.flight.do('categories', self._reload)
+        return categories
+
+    def _reload(self):
+        with self._lock:
+            if self.is_stale():
+                self._install(self.loader())
+            return self._categories
+
+    def refresh(self, docs):
+        """Replace the table with already-fetched category documents (used by the async path)."""
+        with self._lock:
+            self._install(docs)
+
+    def _install(self, docs):
+        categories = {}
+        for doc in docs:
+            try:
+                category_id = int(doc["ID"])
+            except (KeyError, TypeError, ValueError):
+                logging.warning("[CategoryCache] Skipping category with invalid ID: %s", doc.get('ID'))
+                continue
+            categories[category_id] = {lang: doc.get(field) or None for lang, field in CATEGORY_FIELDS.items()}
+        logging.info(f"[CategoryCache] Loaded {len(categories)} categories")
+        self._row_versions = {
+            category_id: hashlib.sha1(json.dumps(names, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+            for category_id, names in categories.items()
+        }
+        ids_by_name = {}
+        for category_id, names in categories.items():
+            if names['en']:
+                ids_by_name.setdefault(category_key(names['en']), category_id)
+        self._ids_by_name = ids_by_name
+        self._categories = categories
+        self._digest = hashlib.sha1(json.dumps(sorted(categories.items()), ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        self._loaded_at = time.monotonic()
+        self.version += 1
+
+    def invalidate(self):
+        """Drop the cached table so the next lookup reloads it."""
+        with self._lock:
+            self._categories = None
+
+    def digest(self):
+        """Content hash of the current table; changes only when a translation changes."""
+        self._table()
+        return self._digest
+
+    def get(self, category_id):
+        """Return the {lang: name} translations for category_id, or None."""
+        return self._table().get(category_id)
+
+    def row_version(self, category_id):
+        """Content hash of one category's translations, or None if it has no row.
+
+        Changes only when that category changes, so labels built from it (see
+        fragments.py) can be checked without hashing the whole table.
+        """
+        self._table()
+        try:
+            return self._row_versions.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def row_versions(self):
+        """{category_id: row_version} for every loaded category."""
+        self._table()
+        return dict(self._row_versions)
+
+    def id_for_name(self, name):
+        """Return the ID of the category whose EN name matches name, or None.
+
+        Case and punctuation are ignored (see category_key), so URL slugs match too.
+        """
+        self._table()
+        return self._ids_by_name.get(category_key(name))
+
+    def translate(self, category_id, lang, default):
+        """Return the category name for lang, falling back to EN and then default."""
+        try:
+            names = self.get(int(category_id))
+        except (TypeError, ValueError) as e:
+            logging.error("[CaptionGen] Lang '%s', Error looking up category ID %s: %s", lang, category_id, e)
+            metrics.category_fallback(lang, 'default')
+            return default
+
+        if not names:
+            logging.warning("[CaptionGen] Lang '%s', No category doc found for ID: %s. Using default: '%s'", lang, category_id, default)
+            metrics.category_fallback(lang, 'default')
+            return default
+        if names.get(lang):
+            return names[lang]
+        if names.get("en"):
+            logging.warning("[CaptionGen] Lang '%s', field '%s' missing for id %s. Using EN: '%s'", lang, CATEGORY_FIELDS.get(lang), category_id, names['en'])
+            metrics.category_fallback(lang, 'en')
+            return names["en"]
+        metrics.category_fallback(lang, 'default')
+        return default
+
+
+def _estimate_size(doc):
+    """Rough in-memory size of a product document, in bytes.
+
+    Nested dicts and lists (such as caption_labels) are counted one level
+    deep, which covers every field a product has.
+    """
+    if doc is None:
+        return 64
+    size = sys.getsizeof(doc)
+    for key, value in doc.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(sys.getsizeof(item_key) + sys.getsizeof(item) for item_key, item in value.items())
+        elif isinstance(value, (list, tuple)):
+            size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class ProductCache:
+    """Per-worker read-through LRU cache in front of a product lookup.
+
+    fetch takes a list of product IDs and returns (found, missing) like
+    lookup_products. Found documents are kept for ttl seconds and IDs that
+    were not found for negative_ttl seconds. The cache is bounded both by
+    entry count and by an estimate of the memory it holds. Cached documents
+    are shared between requests, so callers must copy before mutating them.
+    """
+
+    def __init__(self, fetch, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=600, negative_ttl=60):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # product_id -> (expires_at, doc or None, size)
+        self._keys_by_object_id = {} # Mongo _id -> product_id, for change stream deletes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+
+    def get_many(self, product_ids):
+        """Return (found, missing) for product_ids, fetching only uncached IDs."""
+        keys, cached, to_fetch = self.peek(product_ids)
+        if to_fetch:
+            # IDs another thread is already fetching are waited on, not fetched again
+            cached.update(self.flight.do_many(to_fetch, self._fetch_and_store))
+        return self.resolve(keys, cached)
+
+    def _fetch_and_store(self, keys):
+        return self.store(*self.fetch(keys))
+
+    def peek(self, product_ids):
+        """Split product_ids into cached entries and IDs still to fetch.
+
+        Returns (keys, cached, to_fetch); cached maps key to a document or to
+        None for a negative entry. Callers with their own fetch (the async
+        path) pass the results to store() and then resolve().
+        """
+        keys = list(dict.fromkeys(str(product_id) for product_id in product_ids))
+        cached = {}
+        to_fetch = []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    cached[key] = entry[1]
+                    if entry[1] is None:
+                        self.negative_hits += 1
+                    else:
+                        self.hits += 1
+                else:
+                    to_fetch.append(key)
+                    self.misses += 1
+        return keys, cached, to_fetch
+
+    def store(self, fetched, not_found):
+        """Cache a fetch result and return it as {key: document or None}."""
+        stored = {}
+        with self._lock:
+            for key, doc in fetched.items():
+                self._put(key, doc, self.ttl)
+                stored[key] = doc
+            for key in not_found:
+                self._put(key, None, self.negative_ttl)
+                stored[key] = None
+        return stored
+
+    @staticmethod
+    def resolve(keys, cached):
+        """Turn {key: document or None} into (found, missing) in key order."""
+        found = {}
+        missing = []
+        for key in keys:
+            if cached.get(key) is not None:
+                found[key] = cached[key]
+            else:
+                missing.append(key)
+        return found, missing
+
+    def _put(self, key, doc, ttl):
+        self._discard(key)
+        size = _estimate_size(doc)
+        self._entries[key] = (time.monotonic() + ttl, doc, size)
+        self._bytes += size
+        if doc is not None and '_id' in doc:
+            self._keys_by_object_id[doc['_id']] = key
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[2]
+            if entry[1] is not None:
+                self._keys_by_object_id.pop(entry[1].get('_id'), None)
+
+    def set(self, product_id, doc):
+        """Store a document that was written or fetched elsewhere."""
+        with self._lock:
+            self._put(str(product_id), doc, self.ttl)
+
+    def invalidate(self, product_id=None):
+        """Drop one product, or the whole cache when product_id is None."""
+        with self._lock:
+            if product_id is None:
+                self._entries.clear()
+                self._keys_by_object_id.clear()
+                self._bytes = 0
+            else:
+                self._discard(str(product_id))
+
+    def invalidate_object_id(self, object_id):
+        """Drop the product cached under a Mongo _id."""
+        with self._lock:
+            key = self._keys_by_object_id.get(object_id)
+            if key is not None:
+                self._discard(key)
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+
+def watch_product_changes(collection, cache, listeners=()):
+    """Invalidate cache entries from a MongoDB change stream in a background thread.
+
+    Each listener is also called with every changed product document.
+
+    The stream is reopened whenever it ends: after an invalidate event (a
+    drop or the rename done by sync_catalog.py --atomic) it starts after that
+    event, and after an error it resumes from the last change seen, retrying
+    with backoff. Change streams need a replica set (Atlas always has one);
+    on a standalone server the watcher logs the error and exits, leaving TTL
+    expiry in place.
+    """
+    from pymongo.errors import OperationFailure
+
+    def handle(change):
+        doc = change.get('fullDocument')
+        if doc and 'product_id' in doc:
+            cache.invalidate(doc['product_id'])
+            for listener in listeners:
+                try:
+                    listener(doc)
+                except Exception as e:
+                    logging.error("[ProductCache] Change listener failed: %s", e)
+        elif change.get('operationType') in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            cache.invalidate()
+        if 'documentKey' in change:
+            cache.invalidate_object_id(change['documentKey'].get('_id'))
+
+    def listen():
+        resume = {}
+        delay = 1
+        while True:
+            try:
+                with collection.watch(full_document='updateLookup', **resume) as stream:
+                    logging.info("[ProductCache] Listening for product changes")
+                    for change in stream:
+                        handle(change)
+                        delay = 1
+                        if change.get('operationType') == 'invalidate':
+                            # The stream closes after an invalidate; a new one can only start after it
+                            resume = {'start_after': change['_id']}
+                        else:
+                            resume = {'resume_after': change['_id']}
+                logging.warning("[ProductCache] Change stream closed, reopening")
+            except OperationFailure as e:
+                if e.code == 40573: # change streams are only supported on replica sets
+                    logging.error("[ProductCache] Change streams unavailable, relying on TTL expiry: %s", e)
+                    return
+                # The resume point may be gone; start over from an empty cache
+                logging.error("[ProductCache] Change stream failed, reopening in %ss: %s", delay, e)
+                resume = {}
+                cache.invalidate()
+            except Exception as e:
+                logging.error("[ProductCache] Change stream failed, reopening in %ss: %s", delay, e)
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    thread = threading.Thread(target=listen, name='product-change-stream', daemon=True)
+    thread.start()
+    return thread
+
+
+# Document in the catalog_meta collection whose version is bumped by every import or sync
+CATALOG_META_ID = 'catalog'
+
+
+def bump_catalog_version(db):
+    """Mark the products collection as changed so version-keyed caches are invalidated."""
+    db.catalog_meta.update_one({'_id': CATALOG_META_ID}, {'$inc': {'version': 1}}, upsert=True)
+
+
+def _env_flag(name):
+    return os.getenv(name, '').lower() in ('1', 'true', 'yes')
+
+
+class Catalog:
+    """Catalog backend plus the per-worker caches in front of it.
+
+    backend is "mongo" or "snapshot". The MongoDB client is created lazily on
+    first use in each process, so a Catalog built in a gunicorn master never
+    hands a connected client to its forked workers.
+    """
+
+    CATEGORY_PROJECTION = {"_id": 0, "ID": 1, "EN Category": 1, "FR Category": 1, "JP Category": 1, "ZH Category": 1}
+
+    def __init__(self, backend='mongo', mongodb_uri=None, db_name='products', snapshot_path='catalog.snap',
+                 client_options=None, category_ttl=3600, product_cache_options=None, watch_products=False,
+                 version_ttl=30):
+        self.backend = backend
+        self.mongodb_uri = mongodb_uri
+        self.db_name = db_name
+        self.client_options = client_options or {}
+        self.watch_products = watch_products
+        self.snapshot = None
+        self._client = None
+        self._client_pid = None
+        self._indexes_checked = False
+        # Set when the database still has string product_ids (see schema.has_string_ids)
+        self.string_ids = False
+        self._preloading = False
+        self.version_ttl = version_ttl
+        self._products_version = None
+        self._products_version_checked = 0.0
+        # Called with each changed product document when watch_products is on
+        self.change_listeners = []
+        self._lock = threading.Lock()
+
+        if backend == 'snapshot':
+            from snapshot import CatalogSnapshot
+            logging.info(f"Serving catalog from snapshot {snapshot_path}")
+            self.snapshot = CatalogSnapshot(snapshot_path)
+            fetch_products = self.snapshot.lookup_products
+            load_categories = self.snapshot.load_categories
+        elif backend == 'mongo':
+            fetch_products = lambda product_ids: lookup_products(self.db.products, product_ids, self.string_ids)
+            load_categories = lambda: self.db.categorys.find({}, self.CATEGORY_PROJECTION)
+        else:
+            raise ValueError(f"Unknown catalog backend: {backend}")
+
+        # Category translations are loaded once per worker and refreshed after the TTL
+        self.category_cache = CategoryCache(load_categories, ttl=category_ttl)
+        # Read-through product cache; misses go to the backend in one batched lookup
+        self.product_cache = ProductCache(fetch_products, **(product_cache_options or {}))
+
+    @classmethod
+    def from_env(cls):
+        """Build a Catalog from the environment variables documented in the README."""
+        return cls(
+            backend=os.getenv('CATALOG_BACKEND', 'mongo'),
+            mongodb_uri=os.getenv('MONGODB_URI'),
+            db_name=os.getenv('DB_NAME', 'products'),
+            snapshot_path=os.getenv('CATALOG_SNAPSHOT', 'catalog.snap'),
+            client_options={
+                'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 50)),
+                'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+                'connectTimeoutMS': int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+                'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+                'socketTimeoutMS': int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 10000))
+            },
+            category_ttl=int(os.getenv('CATEGORY_CACHE_TTL', 3600)),
+            product_cache_options={
+                'max_entries': int(os.getenv('PRODUCT_CACHE_SIZE', 10000)),
+                'max_bytes': int(os.getenv('PRODUCT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+                'ttl': int(os.getenv('PRODUCT_CACHE_TTL', 600)),
+                'negative_ttl': int(os.getenv('PRODUCT_CACHE_NEGATIVE_TTL', 60))
+            },
+            watch_products=_env_flag('PRODUCT_CACHE_WATCH'),
+            version_ttl=int(os.getenv('CATALOG_VERSION_TTL', 30))
+        )
+
+    @property
+    def db(self):
+        """The MongoDB database for this process, connecting on first use."""
+        if self.backend != 'mongo':
+            return None
+        pid = os.getpid()
+        if self._client is None or self._client_pid != pid:
+            with self._lock:
+                if self._client is None or self._client_pid != pid:
+                    self._connect(pid)
+        return self._client[self.db_name]
+
+    def _connect(self, pid):
+        from pymongo import MongoClient
+        import certifi
+
+        # A client inherited across fork is unusable; drop it without closing the parent's sockets
+        self._client = None
+        logging.info(f"Opening MongoDB connection pool in process {pid}")
+        client = MongoClient(self.mongodb_uri, tlsCAFile=certifi.where(), connect=False, **self.client_options)
+        self._client = client
+        self._client_pid = pid
+
+        if not self._indexes_checked:
+            self._indexes_checked = True
+            # Unique indexes back the batched lookups; failures are logged but don't block serving
+            try:
+                from schema import ensure_indexes, has_string_ids
+                if not ensure_indexes(client[self.db_name]):
+                    self.string_ids = has_string_ids(client[self.db_name])
+            except Exception as e:
+                logging.error("Error ensuring indexes: %s", e)
+
+        if self.watch_products and not self._preloading:
+            watch_product_changes(client[self.db_name].products, self.product_cache, self.change_listeners)
+
+    def close(self):
+        """Close this process's MongoDB client, e.g. in a master before forking workers."""
+        with self._lock:
+            if self._client is not None and self._client_pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._client_pid = None
+
+    def preload(self, warm=None):
+        """Load categories and warm the product cache, then release the connection.
+
+        Meant for a gunicorn master running with --preload: workers inherit the
+        loaded caches copy-on-write instead of each fetching them. warm, if
+        given, is called first to build other caches from the catalog (e.g.
+        the search index); like the rest of preload it never starts the
+        change stream watcher in the master.
+        """
+        started = time.monotonic()
+        self._preloading = True
+        try:
+            if warm is not None:
+                warm()
+            self.category_cache.get(0)
+            if self.backend == 'mongo':
+                count = 0
+                for doc in self.db.products.find({}).limit(self.product_cache.max_entries):
+                    self.product_cache.set(doc['product_id'], doc)
+                    count += 1
+                self.close()
+                logging.info(f"Preloaded {count} products in {time.monotonic() - started:.2f}s")
+        finally:
+            self._preloading = False
+
+    def iter_products(self, fields):
+        """Yield every product document, with at least the given fields."""
+        if self.snapshot is not None:
+            yield from self.snapshot.iter_products()
+        else:
+            yield from self.db.products.find({}, {'_id': 0, **{field: 1 for field in fields}})
+
+    def save_products(self, docs):
+        """Cache products resolved outside the catalog (see fetcher.py) and store them.
+
+        With the mongo backend each document is inserted only if its product_id
+        is still absent, so an import or sync that got there first wins; the
+        snapshot backend is read-only and only caches them.
+        """
+        for doc in docs:
+            self.product_cache.set(doc['product_id'], doc)
+            for listener in self.change_listeners:
+                try:
+                    listener(doc)
+                except Exception as e:
+                    logging.error("[Catalog] Change listener failed: %s", e)
+        if self.backend == 'mongo' and docs:
+            from pymongo import UpdateOne
+
+            # Match either ID type so a legacy string-ID document is not duplicated
+            self.db.products.bulk_write(
+                [UpdateOne({'product_id': {'$in': [doc['product_id'], str(doc['product_id'])]}}, {'$setOnInsert': doc}, upsert=True)
+                 for doc in docs],
+                ordered=False
+            )
+
+    def products_version(self):
+        """Version of the product data, re-read from catalog_meta at most every version_ttl seconds."""
+        if self.snapshot is not None:
+            return self.snapshot.version
+        if self.products_version_due():
+            self.set_products_version(self.db.catalog_meta.find_one({'_id': CATALOG_META_ID}))
+        return self._products_version
+
+    def products_version_due(self):
+        """True if the products version should be re-read from catalog_meta."""
+        return self._products_version is None or time.monotonic() - self._products_version_checked > self.version_ttl
+
+    def set_products_version(self, meta_doc):
+        """Record the products version from a catalog_meta document read elsewhere (used by the async path)."""
+        self._products_version = (meta_doc or {}).get('version', 0)
+        self._products_version_checked = time.monotonic()
+
+    def version(self):
+        """Combined product and category version, for keying derived caches."""
+        return f"{self.products_version()}:{self.category_cache.digest()}"
+
+    def ping(self):
+        """Return True if the backend can serve lookups."""
+        if self.snapshot is not None:
+            return True
+        self.db.client.admin.command('ping')
+        return True
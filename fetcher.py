@@ -0,0 +1,354 @@
+"""Fallback lookup for products that are not in the catalog yet.
+
+    python fetcher.py https://www.ssense.com/en-us/men/product/martine-rose/belts-suspenders/18516331 ...
+
+New arrivals are often captioned before the next import reaches them. With
+PRODUCT_FALLBACK=1 the app fetches the product page of every ID the catalog
+doesn't have, in one bounded parallel pass per request: at most
+FALLBACK_MAX_PER_PASS pages, FALLBACK_CONCURRENCY at a time over a pooled
+session, each host limited to FALLBACK_RATE requests per second (bursts of
+FALLBACK_BURST), and the request waits at most FALLBACK_DEADLINE seconds.
+Pages still loading at the deadline finish in the background.
+
+Brand, subcategory and product code are read from the page's JSON-LD, with the
+category slug in the URL as a fallback for the subcategory. Resolved products
+are written to db.products (only if still absent, tagged source: "fallback")
+and to the product cache, so the next request is a cache hit. Pages that fail
+are not retried for FALLBACK_RETRY_AFTER seconds. Pages are always requested
+from FALLBACK_BASE_URL with the pasted URL's path, never from the pasted host.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from bs4 import BeautifulSoup
+import requests
+
+USER_AGENT = 'ssense-editorial-caption-generator (product fallback)'
+PRODUCT_CODE_PATTERN = re.compile(r'^\d{6}[MF]\d{6}$')
+# .../product/<brand slug>/<category slug>/<product id>
+PRODUCT_PATH_PATTERN = re.compile(r'/product/([^/]+)/([^/]+)/(\d+)/?$')
+
+
+class TokenBucket:
+    """Allows rate acquisitions per second on average, in bursts of up to burst."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Wait for a token. Returns False if none becomes available within timeout seconds."""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                delay = (1 - self._tokens) / self.rate
+            if deadline is not None and now + delay > deadline:
+                return False
+            time.sleep(delay)
+
+
+class HostRateLimiter:
+    """One TokenBucket per host."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url, timeout=None):
+        host = urlsplit(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket.acquire(timeout)
+
+
+def new_session(pool_size=8):
+    """A requests session keeping up to pool_size connections per host alive."""
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _json_ld_items(data):
+    """Yield every object in a JSON-LD value, descending into lists and @graph."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _json_ld_items(item)
+    elif isinstance(data, dict):
+        yield data
+        yield from _json_ld_items(data.get('@graph'))
+
+
+def _types(item):
+    types = item.get('@type')
+    return types if isinstance(types, list) else [types]
+
+
+def _name(value):
+    if isinstance(value, dict):
+        value = value.get('name')
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def parse_product_page(html, product_id, url, category_cache):
+    """Build a product document from a product page, or return None without a brand and subcategory.
+
+    The subcategory is the first of the JSON-LD Product category, the
+    breadcrumb names (innermost first) and the URL's category slug that
+    matches a category in the table; an unmatched JSON-LD category is kept
+    by name without a subcategory_id.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    items = []
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            items.extend(_json_ld_items(json.loads(script.string or '')))
+        except ValueError:
+            continue
+    product = next((item for item in items if 'Product' in _types(item)), {})
+
+    brand = _name(product.get('brand'))
+    if not brand:
+        meta = soup.find('meta', attrs={'property': 'product:brand'})
+        brand = _name(meta.get('content')) if meta else None
+
+    category = _name(product.get('category'))
+    if category:
+        category = re.split(r'\s*[>/]\s*', category)[-1]
+    candidates = [category] if category else []
+    for item in items:
+        if 'BreadcrumbList' in _types(item):
+            crumbs = [_name(element.get('name')) or _name(element.get('item'))
+                      for element in item.get('itemListElement') or [] if isinstance(element, dict)]
+            candidates.extend(reversed([crumb for crumb in crumbs if crumb]))
+    match = PRODUCT_PATH_PATTERN.search(urlsplit(url).path)
+    if match:
+        candidates.append(match.group(2))
+
+    subcategory_id = subcategory = None
+    for candidate in candidates:
+        subcategory_id = category_cache.id_for_name(candidate)
+        if subcategory_id is not None:
+            subcategory = category_cache.get(subcategory_id)['en']
+            break
+    else:
+        subcategory = category
+    if not brand or not subcategory:
+        return None
+
+    doc = {'product_id': int(product_id), 'brand': brand, 'subcategory': subcategory}
+    if subcategory_id is not None:
+        doc['subcategory_id'] = subcategory_id
+    for field in ('sku', 'mpn', 'productID'):
+        code = str(product.get(field) or '').strip()
+        if PRODUCT_CODE_PATTERN.match(code):
+            doc['product_code'] = code
+            break
+    doc.update({'source': 'fallback', 'fetched_at': datetime.now(timezone.utc)})
+    return doc
+
+
+class ProductFetcher:
+    """Resolves missing products from their product pages and saves them to a Catalog.
+
+    session defaults to a pooled requests session created in each process;
+    pass one (and base_url) to fetch from a test server instead.
+    """
+
+    def __init__(self, catalog, session=None, base_url='https://www.ssense.com', rate=2.0, burst=4,
+                 concurrency=8, timeout=5.0, deadline=8.0, max_per_pass=20, retry_after=600):
+        self.catalog = catalog
+        self.base_url = base_url.rstrip('/')
+        self.limiter = HostRateLimiter(rate, burst)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_per_pass = max_per_pass
+        self.retry_after = retry_after
+        self.resolved = 0
+        self.failed = 0
+        self._session = session
+        self._own_session = session is None
+        self._pool = None
+        self._pid = None
+        self._in_flight = {} # product_id -> Future
+        self._retry_at = {} # product_id -> monotonic time before which a failed page is not fetched again
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, catalog):
+        """Build a ProductFetcher from the FALLBACK_* environment variables documented in the README."""
+        return cls(
+            catalog,
+            base_url=os.getenv('FALLBACK_BASE_URL', 'https://www.ssense.com'),
+            rate=float(os.getenv('FALLBACK_RATE', 2)),
+            burst=int(os.getenv('FALLBACK_BURST', 4)),
+            concurrency=int(os.getenv('FALLBACK_CONCURRENCY', 8)),
+            timeout=float(os.getenv('FALLBACK_TIMEOUT', 5)),
+            deadline=float(os.getenv('FALLBACK_DEADLINE', 8)),
+            max_per_pass=int(os.getenv('FALLBACK_MAX_PER_PASS', 20)),
+            retry_after=int(os.getenv('FALLBACK_RETRY_AFTER', 600))
+        )
+
+    def page_url(self, url):
+        """The page fetched for a pasted product URL: its path on base_url."""
+        return self.base_url + urlsplit(url).path
+
+    def _executor(self):
+        # Threads and pooled connections don't survive a fork; each process makes its own
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='product-fallback')
+            if self._own_session:
+                self._session = new_session(self.concurrency)
+            self._in_flight = {}
+            self._pid = pid
+        return self._pool
+
+    def resolve(self, urls_by_id):
+        """Fetch the products in {product_id: url} in one bounded pass. Returns {product_id: doc} for those resolved.
+
+        IDs whose page failed recently are skipped, and IDs another request is
+        already fetching are waited on rather than fetched again.
+        """
+        futures = {}
+        with self._lock:
+            pool = self._executor()
+            now = time.monotonic()
+            for product_id, url in urls_by_id.items():
+                if len(futures) >= self.max_per_pass:
+                    break
+                if self._retry_at.get(product_id, 0) > now:
+                    continue
+                future = self._in_flight.get(product_id)
+                if future is None:
+                    future = self._in_flight[product_id] = pool.submit(self._fetch, product_id, url)
+                futures[product_id] = future
+        if not futures:
+            return {}
+
+        done, pending = wait(futures.values(), timeout=self.deadline)
+        if pending:
+            logging.warning("[Fallback] %d of %d product pages still loading after %.1fs", len(pending), len(futures), self.deadline)
+        return {
+            product_id: future.result() for product_id, future in futures.items()
+            if future in done and future.result() is not None
+        }
+
+    def _fetch(self, product_id, url):
+        page_url = self.page_url(url)
+        try:
+            # Waiting longer than a pass lasts is pointless; a later request will ask again
+            if not self.limiter.acquire(page_url, self.deadline):
+                logging.warning("[Fallback] Rate limit reached, not fetching product %s", product_id)
+                return None
+            response = self._session.get(page_url, timeout=self.timeout)
+            response.raise_for_status()
+            doc = parse_product_page(response.text, product_id, page_url, self.catalog.category_cache)
+            if doc is None:
+                raise ValueError("no brand or subcategory on the page")
+        except Exception as e:
+            logging.warning("[Fallback] Could not resolve product %s from %s: %s", product_id, page_url, e)
+            with self._lock:
+                self.failed += 1
+                self._retry_at[product_id] = time.monotonic() + self.retry_after
+                if len(self._retry_at) > 10000:
+                    now = time.monotonic()
+                    self._retry_at = {key: retry_at for key, retry_at in self._retry_at.items() if retry_at > now}
+            return None
+        finally:
+            with self._lock:
+                self._in_flight.pop(product_id, None)
+
+        try:
+            self.catalog.save_products([doc])
+        except Exception as e:
+            # Still cached in this worker; the next import or fetch writes it
+            logging.error("[Fallback] Could not save product %s: %s", product_id, e)
+        with self._lock:
+            self.resolved += 1
+        logging.info("[Fallback] Resolved product %s: %s - %s", product_id, doc['brand'], doc['subcategory'])
+        return doc
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resolved': self.resolved,
+                'failed': self.failed,
+                'in_flight': len(self._in_flight),
+                'backing_off': sum(1 for retry_at in self._retry_at.values() if retry_at > time.monotonic())
+            }
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from app import extract_product_id
+    from catalog import Catalog
+    from logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Fetch products missing from the catalog from their product pages.")
+    parser.add_argument('urls', nargs='+', help="product URLs")
+    parser.add_argument('--base-url', default=None, help="fetch pages from this host (default: FALLBACK_BASE_URL or ssense.com)")
+    parser.add_argument('--concurrency', type=int, default=8, help="pages fetched at once")
+    parser.add_argument('--rate', type=float, default=2.0, help="requests per second per host")
+    parser.add_argument('--deadline', type=float, default=60, help="seconds to wait for the whole pass")
+    args = parser.parse_args()
+
+    load_dotenv()
+    configure_logging()
+    catalog = Catalog.from_env()
+    try:
+        urls_by_id = {}
+        for url in args.urls:
+            product_id = extract_product_id(url)
+            if product_id:
+                urls_by_id.setdefault(product_id, url)
+            else:
+                print(f"Could not extract product ID from URL: {url}")
+        found, missing = catalog.product_cache.get_many(list(urls_by_id))
+        print(f"{len(found)} of {len(urls_by_id)} products already in the catalog")
+        if not missing:
+            return
+
+        fetcher = ProductFetcher(
+            catalog, base_url=args.base_url or os.getenv('FALLBACK_BASE_URL', 'https://www.ssense.com'),
+            rate=args.rate, concurrency=args.concurrency, deadline=args.deadline, max_per_pass=len(missing)
+        )
+        started = time.monotonic()
+        resolved = fetcher.resolve({product_id: urls_by_id[product_id] for product_id in missing})
+        for product_id in missing:
+            doc = resolved.get(product_id)
+            print(f"{product_id}: {doc['brand']} - {doc['subcategory']}" if doc else f"{product_id}: not resolved")
+        print(f"Resolved {len(resolved)} of {len(missing)} missing products in {time.monotonic() - started:.1f}s")
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+    main()
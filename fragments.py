@@ -0,0 +1,166 @@
+"""Pre-rendered caption link labels, materialized onto each product document.
+
+    python fragments.py                       # products whose category translations changed since the last run
+    python fragments.py --all                 # recheck every product
+    python fragments.py --products 18516331,17468731
+
+Every caption links each product as "[Brand Category](url)" ("[Category Brand]"
+in French). The label depends only on the product and its category's
+translations, never on the request, so it is computed ahead of time and stored
+as products.caption_labels:
+
+    {"en": ..., "fr": ..., "jp": ..., "zh": ...,
+     "brand": ..., "subcategory_id": ..., "subcategory": ..., "version": <category row version>}
+
+At request time a stored label is used only while the product's brand and
+subcategory and the category row it was built from are unchanged; otherwise
+the caption translates the category live as before, so stale labels cost a
+little speed, never correctness. import_products.py and sync_catalog.py
+refresh labels after writing products.
+"""
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+import argparse
+import os
+import certifi
+import time
+
+from captions import LANGUAGES, link_label
+from catalog import Catalog, CategoryCache
+from logging_setup import configure_logging
+
+# Load environment variables
+load_dotenv()
+
+LABELS_FIELD = 'caption_labels'
+# catalog_meta document remembering the category row versions labels were last built from
+LABELS_META_ID = 'caption_labels'
+LABEL_PROJECTION = {'product_id': 1, 'brand': 1, 'subcategory_id': 1, 'subcategory': 1, LABELS_FIELD: 1}
+
+
+def product_labels(product, category_cache):
+    """Build the caption_labels value for product from the current category table."""
+    subcategory_id = product.get('subcategory_id')
+    default = product.get('subcategory', 'Unknown')
+    labels = {
+        lang: link_label(lang, product['brand'], category_cache.translate(subcategory_id, lang, default))
+        for lang in LANGUAGES
+    }
+    labels.update({
+        'brand': product['brand'],
+        'subcategory_id': subcategory_id,
+        'subcategory': product.get('subcategory'),
+        'version': category_cache.row_version(subcategory_id)
+    })
+    return labels
+
+
+def stored_labels(product, category_cache):
+    """Return product's materialized labels if they are still current, else None."""
+    labels = product.get(LABELS_FIELD)
+    if not labels:
+        return None
+    subcategory_id = product.get('subcategory_id')
+    if (labels.get('brand') != product.get('brand')
+            or labels.get('subcategory_id') != subcategory_id
+            or labels.get('subcategory') != product.get('subcategory')
+            or labels.get('version') != category_cache.row_version(subcategory_id)):
+        return None
+    return labels
+
+
+def materialize_labels(collection, category_cache, query, batch_size=1000):
+    """Rebuild labels for the products matching query, writing only those that changed.
+
+    Returns (checked, updated).
+    """
+    checked = updated = 0
+    operations = []
+    for product in collection.find(query, LABEL_PROJECTION):
+        if not product.get('brand'):
+            continue
+        checked += 1
+        labels = product_labels(product, category_cache)
+        if product.get(LABELS_FIELD) == labels:
+            continue
+        operations.append(UpdateOne({'_id': product['_id']}, {'$set': {LABELS_FIELD: labels}}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    return checked, updated
+
+
+def refresh_labels(db, product_ids=None, everything=False, batch_size=1000):
+    """Bring caption_labels up to date. Returns a dict of totals.
+
+    With product_ids, only those products are rebuilt (after an import or sync
+    touched them). Otherwise the category table is compared with the row
+    versions saved by the previous run and only products in categories whose
+    translations were added, changed or removed are rebuilt; everything=True
+    rechecks every product.
+    """
+    category_cache = CategoryCache(lambda: db.categorys.find({}, Catalog.CATEGORY_PROJECTION), ttl=None)
+    totals = {'checked': 0, 'updated': 0}
+
+    def apply(query):
+        checked, updated = materialize_labels(db.products, category_cache, query, batch_size)
+        totals['checked'] += checked
+        totals['updated'] += updated
+
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), batch_size):
+            apply({'product_id': {'$in': product_ids[start:start + batch_size]}})
+        return totals
+
+    versions = category_cache.row_versions()
+    if everything:
+        apply({})
+    else:
+        meta = db.catalog_meta.find_one({'_id': LABELS_META_ID}) or {}
+        previous = {int(category_id): version for category_id, version in meta.get('versions', {}).items()}
+        changed = [category_id for category_id in set(versions) | set(previous) if versions.get(category_id) != previous.get(category_id)]
+        totals['categories_changed'] = len(changed)
+        for start in range(0, len(changed), batch_size):
+            apply({'subcategory_id': {'$in': changed[start:start + batch_size]}})
+
+    db.catalog_meta.update_one(
+        {'_id': LABELS_META_ID},
+        {'$set': {'versions': {str(category_id): version for category_id, version in versions.items()}}},
+        upsert=True
+    )
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize pre-rendered caption link labels onto products.")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument('--all', action='store_true', help="recheck every product")
+    scope.add_argument('--products', help="comma-separated product IDs to rebuild")
+    parser.add_argument('--batch-size', type=int, default=1000, help="products per bulk write")
+    args = parser.parse_args()
+
+    # Rate-limits the category fallback warnings a full rebuild can produce
+    configure_logging()
+    client = None
+    try:
+        # Connect to MongoDB
+        print("Connecting to MongoDB...")
+        client = MongoClient(os.getenv('MONGODB_URI'), tlsCAFile=certifi.where())
+        db = client[os.getenv('DB_NAME', 'products')]
+
+        started = time.monotonic()
+        product_ids = [int(product_id) for product_id in args.products.split(',')] if args.products else None
+        totals = refresh_labels(db, product_ids, args.all, args.batch_size)
+        print(f"Checked {totals['checked']} products, updated labels on {totals['updated']} in {time.monotonic() - started:.1f}s")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if client:
+            client.close()
+
+if __name__ == '__main__':
+    main()
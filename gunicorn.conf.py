@@ -0,0 +1,12 @@
+"""Gunicorn settings for the caption service. Values come from the environment."""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+# With PRELOAD_CATALOG the app is built once in the master, which loads the
+# category and product caches there; workers inherit them copy-on-write and
+# open their own MongoDB connection pools lazily after fork.
+preload_app = os.getenv('PRELOAD_CATALOG', '').lower() in ('1', 'true', 'yes')
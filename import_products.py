@@ -1,58 +1,170 @@
-from pymongo import MongoClient
+"""Stream products.txt (JSONL) into MongoDB with chunked, idempotent upserts.
+
+    python import_products.py --file products.txt --batch-size 1000 --workers 4
+
+Products are upserted by product_id, so re-running the import updates
+documents in place instead of creating duplicates. IDs are stored as ints,
+the same way fix_data.py normalizes them. Only one chunk per worker is held
+in memory at a time.
+"""
+from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
 import os
 import certifi
 import json
+import time
+
+from catalog import bump_catalog_version
+from fragments import refresh_labels
+from logging_setup import configure_logging
+from schema import ensure_indexes
 
 # Load environment variables
 load_dotenv()
 
 def clean_json_string(json_str):
     # Remove any potential BOM or special characters
-    json_str = json_str.strip()
+    json_str = json_str.strip().lstrip('\ufeff')
     # Handle any potential trailing commas
     if json_str.endswith(','):
         json_str = json_str[:-1]
     return json_str
 
-try:
-    # Connect to MongoDB
-    print("Connecting to MongoDB...")
-    client = MongoClient(os.getenv('MONGODB_URI'), tlsCAFile=certifi.where())
-    
-    # Use the products database
-    db = client['products']
-    collection = db['products']
-    
-    # Path to your data file
-    file_path = 'products.txt'  # You'll need to create this file with your data
-    
-    # Read and import the data
+def normalize_product(product):
+    """Convert product_id and subcategory_id to ints. Returns None if product_id is invalid."""
+    try:
+        product['product_id'] = int(product['product_id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if 'subcategory_id' in product:
+        try:
+            product['subcategory_id'] = int(product['subcategory_id'])
+        except (TypeError, ValueError):
+            pass
+    return product
+
+def parse_lines(lines):
+    """Parse and normalize a list of JSONL lines. Returns (products, error_count)."""
     products = []
+    errors = 0
+    for line in lines:
+        clean_line = clean_json_string(line)
+        if not clean_line:
+            continue
+        try:
+            product = normalize_product(json.loads(clean_line))
+        except json.JSONDecodeError as e:
+            print(f"Error parsing line: {line.strip()}")
+            print(f"Error details: {e}")
+            errors += 1
+            continue
+        if product is None:
+            print(f"Skipping product without a numeric product_id: {line.strip()}")
+            errors += 1
+            continue
+        products.append(product)
+    return products, errors
+
+def read_line_chunks(file_path, chunk_size):
+    """Yield lists of up to chunk_size raw lines from file_path."""
     with open(file_path, 'r', encoding='utf-8') as file:
+        chunk = []
         for line in file:
-            try:
-                # Clean and parse each line as JSON
-                clean_line = clean_json_string(line)
-                product = json.loads(clean_line)
-                products.append(product)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing line: {line}")
-                print(f"Error details: {e}")
-                continue
-    
-    if products:
-        # Insert all products
-        result = collection.insert_many(products)
-        print(f"Successfully inserted {len(result.inserted_ids)} products")
-        
-        # Verify the count
-        total_docs = collection.count_documents({})
-        print(f"Total documents in collection: {total_docs}")
-    else:
-        print("No products were parsed successfully")
-
-except Exception as e:
-    print(f"An error occurred: {e}")
-finally:
-    client.close() 
\ No newline at end of file
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def iter_product_chunks(file_path, chunk_size=1000, workers=1):
+    """Yield (products, error_count) per chunk, parsing across a process pool when workers > 1.
+
+    At most two chunks per worker are in flight, so memory stays constant
+    regardless of file size. Chunks are yielded in file order.
+    """
+    if workers <= 1:
+        for lines in read_line_chunks(file_path, chunk_size):
+            yield parse_lines(lines)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for lines in read_line_chunks(file_path, chunk_size):
+            pending.append(pool.submit(parse_lines, lines))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def upsert_products(collection, products):
+    """Upsert one chunk of products by product_id with an unordered bulk write."""
+    operations = [
+        # Match either ID type so legacy string-ID documents are converted in place
+        UpdateOne({'product_id': {'$in': [product['product_id'], str(product['product_id'])]}}, {'$set': product}, upsert=True)
+        for product in products
+    ]
+    return collection.bulk_write(operations, ordered=False)
+
+def import_products(collection, file_path, batch_size=1000, workers=1):
+    """Stream file_path into collection. Returns a dict of import totals."""
+    totals = {'parsed': 0, 'errors': 0, 'inserted': 0, 'updated': 0}
+    started = time.monotonic()
+    for products, errors in iter_product_chunks(file_path, batch_size, workers):
+        totals['errors'] += errors
+        if not products:
+            continue
+        result = upsert_products(collection, products)
+        totals['parsed'] += len(products)
+        totals['inserted'] += result.upserted_count
+        totals['updated'] += result.modified_count
+        elapsed = time.monotonic() - started
+        print(f"Imported {totals['parsed']} products ({totals['parsed'] / max(elapsed, 1e-6):.0f}/s): "
+              f"{totals['inserted']} inserted, {totals['updated']} updated, {totals['errors']} errors")
+    totals['seconds'] = time.monotonic() - started
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Import products from a JSONL file into MongoDB.")
+    parser.add_argument('--file', default='products.txt', help="JSONL product file")
+    parser.add_argument('--batch-size', type=int, default=1000, help="products per bulk write")
+    parser.add_argument('--workers', type=int, default=1, help="parser processes")
+    args = parser.parse_args()
+
+    configure_logging()
+    client = None
+    try:
+        # Connect to MongoDB
+        print("Connecting to MongoDB...")
+        client = MongoClient(os.getenv('MONGODB_URI'), tlsCAFile=certifi.where())
+
+        # Use the products database
+        db = client[os.getenv('DB_NAME', 'products')]
+        collection = db['products']
+
+        # Index product_id first so each upsert's lookup doesn't scan the collection
+        ensure_indexes(db)
+        totals = import_products(collection, args.file, args.batch_size, args.workers)
+        bump_catalog_version(db)
+        if totals['parsed']:
+            labels = refresh_labels(db, everything=True, batch_size=args.batch_size)
+            print(f"Refreshed caption labels on {labels['updated']} of {labels['checked']} products")
+            print(f"Successfully imported {totals['parsed']} products in {totals['seconds']:.1f}s")
+
+            # Verify the count
+            total_docs = collection.count_documents({})
+            print(f"Total documents in collection: {total_docs}")
+        else:
+            print("No products were parsed successfully")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if client:
+            client.close()
+
+if __name__ == '__main__':
+    main()
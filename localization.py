@@ -0,0 +1,64 @@
+"""SSENSE URL localization for the caption languages."""
+from functools import lru_cache
+import logging
+import os
+import re
+
+# URL locale segment for each caption language
+URL_LANGUAGES = {
+    "en": "en",
+    "fr": "fr",
+    "jp": "ja",
+    "zh": "zh"
+}
+
+# Path words that are translated in French URLs
+FR_PATH_WORDS = {
+    "product": "produit",
+    "men": "hommes",
+    "women": "femmes"
+}
+
+# One compiled rewrite per target language: the /en-us or /en-ca locale segment
+# plus any language-specific path words, matched as whole segments in one pass
+LOCALE_PATTERN = r'en-(?:us|ca)'
+REWRITES = {
+    "fr": (re.compile(rf'/({LOCALE_PATTERN}|{"|".join(FR_PATH_WORDS)})(?=/)'), FR_PATH_WORDS),
+    "ja": (re.compile(rf'/({LOCALE_PATTERN})(?=/)'), {}),
+    "zh": (re.compile(rf'/({LOCALE_PATTERN})(?=/)'), {})
+}
+
+
+@lru_cache(maxsize=int(os.getenv('URL_CACHE_SIZE', 65536)))
+def convert_url_to_language(url, target_lang):
+    """Convert English (en-us or en-ca) URL to target language URL (e.g., /fr/, /ja/, /zh/)."""
+    if target_lang == "en":
+        return url
+
+    if target_lang not in REWRITES:
+        logging.warning("Unsupported target language for URL conversion: %s", target_lang)
+        return url # Return original URL if language not supported
+
+    pattern, path_words = REWRITES[target_lang]
+    found_locale = False
+
+    def replace(match):
+        nonlocal found_locale
+        segment = match.group(1)
+        if segment in path_words:
+            return f"/{path_words[segment]}"
+        found_locale = True
+        return f"/{target_lang}"
+
+    new_url = pattern.sub(replace, url)
+    if not found_locale:
+        logging.warning("Could not find /en-us/ or /en-ca/ pattern in URL: %s", url)
+        return url # Return original URL if pattern not found
+
+    logging.debug("Converted URL for %s: %s", target_lang, new_url)
+    return new_url
+
+
+def localize_url(url):
+    """Return {caption_lang: url} for every caption language."""
+    return {lang: convert_url_to_language(url, url_lang) for lang, url_lang in URL_LANGUAGES.items()}
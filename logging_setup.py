@@ -0,0 +1,143 @@
+"""Logging configuration for the caption service.
+
+    LOG_LEVEL=INFO          root level
+    LOG_MODE=queue          hand records to a background thread instead of writing on the request thread
+    LOG_FORMAT=json         one JSON object per line instead of plain text
+    LOG_RATE_LIMIT=20       max records per message template per LOG_RATE_INTERVAL seconds at WARNING
+                            and above; 0 disables the limit
+    LOG_RATE_INTERVAL=60
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `rate` records per message template per `interval` seconds.
+
+    Records are grouped by their unformatted message, so this relies on
+    %-style logging calls: every "category field missing" warning shares one
+    template no matter which category it names. The first record after a
+    window with drops notes how many were suppressed. Records below min_level
+    are never limited. Once more than max_windows templates are tracked,
+    expired windows are dropped, then the older half if still needed.
+    """
+
+    def __init__(self, rate=20, interval=60, min_level=logging.WARNING, max_windows=1000):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self.min_level = min_level
+        self.max_windows = max_windows
+        self._windows = {} # (logger, template) -> [window_start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        self._windows = {key: window for key, window in self._windows.items() if now - window[0] < self.interval}
+        if len(self._windows) >= self.max_windows:
+            # Many distinct templates within one interval: forget the older half
+            newest = sorted(self._windows.items(), key=lambda item: item[1][0])[len(self._windows) // 2:]
+            self._windows = dict(newest)
+
+    def filter(self, record):
+        if record.levelno < self.min_level or not self.rate:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= self.max_windows:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.rate:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def _env_flag(value, *accepted):
+    return value.lower() in accepted
+
+
+def configure_logging():
+    """Configure the root logger from the environment. Safe to call more than once."""
+    global _listener
+
+    formatter = JsonFormatter() if _env_flag(os.getenv('LOG_FORMAT', ''), 'json') else logging.Formatter(TEXT_FORMAT)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    rate_limit = RateLimitFilter(
+        rate=int(os.getenv('LOG_RATE_LIMIT', 20)),
+        interval=float(os.getenv('LOG_RATE_INTERVAL', 60))
+    )
+
+    if _env_flag(os.getenv('LOG_MODE', ''), 'queue'):
+        # The request thread only enqueues; a listener thread formats and writes
+        log_queue = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.addFilter(rate_limit)
+        root.addHandler(handler)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+    else:
+        output.addFilter(rate_limit)
+        root.addHandler(output)
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive fork (e.g. gunicorn --preload); start a fresh one
+    global _listener
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
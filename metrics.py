@@ -0,0 +1,82 @@
+"""Per-stage timing and counters for the caption pipeline, exposed for Prometheus.
+
+Set METRICS_ENABLED=1 to record; when it is off every helper is a no-op and
+prometheus_client is never imported. Under gunicorn with several workers, also
+set PROMETHEUS_MULTIPROC_DIR to an empty directory so /metrics aggregates all
+workers.
+"""
+from contextlib import contextmanager, nullcontext
+import os
+import time
+
+from captions import TEMPLATES
+
+ENABLED = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# Stage names used by the pipeline
+PARSE = 'parse_urls'
+PRODUCT_LOOKUP = 'product_lookup'
+FALLBACK_FETCH = 'fallback_fetch'
+LOCALIZE = 'localize_urls'
+CATEGORY_LOOKUP = 'category_lookup'
+RENDER = 'render'
+TOTAL = 'total'
+
+_NOOP = nullcontext()
+
+if ENABLED:
+    from prometheus_client import Counter, Histogram
+
+    STAGE_SECONDS = Histogram(
+        'caption_stage_seconds', 'Time spent in each caption pipeline stage',
+        ['stage', 'language', 'template'],
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    )
+    PRODUCTS_NOT_FOUND = Counter('caption_products_not_found_total', 'Products looked up but not found')
+    CATEGORY_FALLBACKS = Counter(
+        'caption_category_fallbacks_total', 'Category names that fell back to EN or to the product subcategory',
+        ['language', 'fallback']
+    )
+
+
+@contextmanager
+def _timed(stage, language, template):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage, language, template).observe(time.perf_counter() - started)
+
+
+def span(stage, language='all', template='all'):
+    """Context manager timing one pipeline stage; free when metrics are disabled."""
+    if not ENABLED:
+        return _NOOP
+    # Templates come from request bodies; keep label cardinality bounded
+    if not isinstance(template, str) or (template not in TEMPLATES['en'] and template not in ('all', 'batch')):
+        template = 'unknown'
+    return _timed(stage, language, template)
+
+
+def products_not_found(count=1):
+    if ENABLED and count:
+        PRODUCTS_NOT_FOUND.inc(count)
+
+
+def category_fallback(language, fallback):
+    """Count a category name that used the EN name ('en') or the product subcategory ('default')."""
+    if ENABLED:
+        CATEGORY_FALLBACKS.labels(language, fallback).inc()
+
+
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint."""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
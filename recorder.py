@@ -0,0 +1,116 @@
+"""Opt-in recording of /generate traffic for replay.py.
+
+Set RECORD_TRAFFIC=1 to append every /generate request to JSONL files in
+RECORD_DIR (default recordings/), one file per worker process, rotated at
+RECORD_MAX_BYTES (default 50 MB) keeping RECORD_BACKUPS old files (default 10).
+RECORD_SAMPLE_RATE (0-1, default 1) records only a fraction of requests.
+Conditional requests answered with 304 are not recorded. Each line holds the
+request payload, its arrival time, status, server-side duration, the captions
+returned and a hash of them. Lines are written by a background thread, so
+recording never blocks the request.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+from flask import g, request
+
+RECORDED_PATHS = ('/generate',)
+
+
+def captions_hash(captions):
+    """Stable hash of a {lang: caption} dict, for comparing replayed responses."""
+    canonical = json.dumps(captions, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class TrafficRecorder:
+    """Flask extension recording /generate requests and responses to rotating JSONL files."""
+
+    def __init__(self, directory='recordings', max_bytes=50 * 1024 * 1024, backup_count=10, sample_rate=1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.sample_rate = sample_rate
+        self.recorded = 0
+        self._records = None
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.getenv('RECORD_DIR', 'recordings'),
+            max_bytes=int(os.getenv('RECORD_MAX_BYTES', 50 * 1024 * 1024)),
+            backup_count=int(os.getenv('RECORD_BACKUPS', 10)),
+            sample_rate=float(os.getenv('RECORD_SAMPLE_RATE', 1.0))
+        )
+
+    def init_app(self, app):
+        app.extensions['recorder'] = self
+        app.before_request(self._start)
+        app.after_request(self._record)
+
+    def _queue(self):
+        # One file and writer thread per process; a writer inherited across fork has no thread
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = os.path.join(self.directory, f"generate-{pid}.jsonl")
+                    handler = logging.handlers.RotatingFileHandler(
+                        path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+                    )
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    self._records = queue.SimpleQueue()
+                    self._listener = logging.handlers.QueueListener(self._records, handler)
+                    self._listener.start()
+                    atexit.register(self.close)
+                    self._pid = pid
+                    logging.info("Recording /generate traffic to %s", path)
+        return self._records
+
+    def _start(self):
+        if request.path in RECORDED_PATHS and request.method == 'POST':
+            if self.sample_rate >= 1 or random.random() < self.sample_rate:
+                g.record_started = (time.time(), time.perf_counter())
+
+    def _record(self, response):
+        started = g.pop('record_started', None)
+        # A 304 carries no captions and depends on the client's cached ETag; there is nothing to replay
+        if started is None or response.status_code == 304:
+            return response
+        try:
+            body = response.get_json(silent=True) if response.is_json else None
+            captions = (body or {}).get('captions')
+            entry = {
+                'time': started[0],
+                'path': request.path,
+                'payload': request.get_json(silent=True),
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started[1]) * 1000, 3),
+                'captions': captions,
+                'result_hash': captions_hash(captions) if captions is not None else None
+            }
+            # Enqueued as a bare record: the file handler sits outside the logging tree, so
+            # logging configuration (levels, logging.disable) never drops recordings
+            self._queue().put(logging.makeLogRecord({'msg': json.dumps(entry, ensure_ascii=False)}))
+            self.recorded += 1
+        except Exception as e:
+            logging.warning("Could not record request: %s", e)
+        return response
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
@@ -0,0 +1,179 @@
+"""Replay recorded /generate traffic against a running instance and diff the captions.
+
+    python replay.py recordings/ --target http://localhost:8080 --rate 2 --concurrency 8
+
+Reads the JSONL files written by the recorder (RECORD_TRAFFIC=1, see
+recorder.py) and sends each payload at its recorded offset divided by --rate
+(--rate 0 sends as fast as --concurrency allows). Every response is compared
+with the recorded captions; mismatches are printed as per-language diffs.
+Differences are expected where the catalog changed since the recording.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import difflib
+import glob
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+from recorder import captions_hash
+
+
+def recording_files(paths):
+    """Expand directories to the recording files inside them (rotated backups included)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, 'generate-*.jsonl*'))))
+        else:
+            files.append(path)
+    return files
+
+
+def load_recordings(paths, limit=None):
+    """Return recorded /generate entries from paths, in arrival order."""
+    entries = []
+    for path in recording_files(paths):
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Skipping unparseable line in {path}: {e}")
+                    continue
+                # 304s (in recordings made before they were skipped) have no captions to compare
+                if isinstance(entry.get('payload'), dict) and entry.get('status') != 304:
+                    entries.append(entry)
+    entries.sort(key=lambda entry: entry['time'])
+    return entries[:limit] if limit else entries
+
+
+def caption_diff(expected, actual):
+    """Return diff lines for each language whose caption changed."""
+    lines = []
+    for lang in sorted(set(expected) | set(actual)):
+        if expected.get(lang) != actual.get(lang):
+            lines.append(f"  [{lang}]")
+            lines.extend(f"    {line.rstrip()}" for line in difflib.ndiff([expected.get(lang) or ''], [actual.get(lang) or '']))
+    return lines
+
+
+class Replay:
+    """Sends recorded entries on schedule and tallies the results."""
+
+    def __init__(self, session, target, timeout=30):
+        self.session = session
+        self.url = target.rstrip('/') + '/generate'
+        self.timeout = timeout
+        self.latencies = []
+        self.lag = []
+        self.matched = 0
+        self.mismatched = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def send(self, index, entry, scheduled_at):
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.url, json=entry['payload'], timeout=self.timeout)
+            latency = time.perf_counter() - started
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            with self._lock:
+                self.failed += 1
+            print(f"#{index} request failed: {e}")
+            return
+
+        captions = body.get('captions')
+        mismatch = response.status_code != entry['status'] or (
+            entry.get('result_hash') is not None and (captions is None or captions_hash(captions) != entry['result_hash'])
+        )
+        with self._lock:
+            self.latencies.append(latency)
+            self.lag.append(max(0.0, started - scheduled_at))
+            if mismatch:
+                self.mismatched += 1
+            else:
+                self.matched += 1
+        if mismatch:
+            report = [f"#{index} differs (status {entry['status']} -> {response.status_code})"]
+            if entry.get('captions') and captions:
+                report.extend(caption_diff(entry['captions'], captions))
+            print('\n'.join(report))
+
+    def run(self, entries, rate=1.0, concurrency=4):
+        start = time.perf_counter()
+        first = entries[0]['time'] if entries else 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for index, entry in enumerate(entries):
+                scheduled_at = start + ((entry['time'] - first) / rate if rate > 0 else 0)
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, index, entry, scheduled_at)
+        return time.perf_counter() - start
+
+    def summary(self, elapsed):
+        result = {
+            'sent': self.matched + self.mismatched + self.failed,
+            'matched': self.matched,
+            'mismatched': self.mismatched,
+            'failed': self.failed,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_per_s': round((self.matched + self.mismatched) / max(elapsed, 1e-6), 1)
+        }
+        if len(self.latencies) >= 2:
+            cuts = statistics.quantiles(self.latencies, n=100, method='inclusive')
+            result.update({
+                'p50_ms': round(cuts[49] * 1000, 3),
+                'p95_ms': round(cuts[94] * 1000, 3),
+                'p99_ms': round(cuts[98] * 1000, 3),
+                'max_send_lag_ms': round(max(self.lag) * 1000, 3)
+            })
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded /generate traffic and diff the captions")
+    parser.add_argument('paths', nargs='*', default=['recordings'], help="Recording files or directories")
+    parser.add_argument('--target', default='http://localhost:8080', help="Base URL of the instance to replay against")
+    parser.add_argument('--rate', type=float, default=1.0, help="Speed-up over the recorded rate; 0 sends as fast as possible")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight at once")
+    parser.add_argument('--limit', type=int, help="Replay only the first N recorded requests")
+    parser.add_argument('--timeout', type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument('--report', help="Write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    entries = load_recordings(args.paths, args.limit)
+    if not entries:
+        print("No recorded requests found")
+        sys.exit(1)
+    pace = f"{args.rate}x the recorded rate" if args.rate > 0 else "maximum rate"
+    print(f"Replaying {len(entries)} requests against {args.target} at {pace} with concurrency {args.concurrency}")
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    replay = Replay(session, args.target, args.timeout)
+    summary = replay.summary(replay.run(entries, args.rate, args.concurrency))
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+
+    if summary['mismatched'] or summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
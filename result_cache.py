@@ -0,0 +1,102 @@
+"""Memoized /generate responses keyed by a canonical hash of the request."""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+def result_key(urls, template_type, talent_name, catalog_version):
+    """Canonical hash of everything a caption depends on; also used as the ETag.
+
+    The URLs are hashed rather than just their product IDs because each
+    caption links to the localized form of the URL that was pasted.
+    """
+    canonical = json.dumps([list(urls), template_type, talent_name, catalog_version], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Bounded LRU of response bodies with a TTL, optionally backed by Redis.
+
+    With a Redis client the entries are shared between workers and hosts;
+    otherwise they live in this process. Keys include the catalog version, so
+    an import, sync or category change makes old entries unreachable.
+    """
+
+    def __init__(self, max_entries=1000, ttl=300, redis_client=None, redis_prefix='captions:'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis = redis_client
+        self.redis_prefix = redis_prefix
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (expires_at, body)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        redis_client = None
+        redis_url = os.getenv('REDIS_URL')
+        if redis_url:
+            try:
+                import redis
+                redis_client = redis.Redis.from_url(redis_url)
+            except ImportError:
+                logging.warning("REDIS_URL is set but the redis package is not installed; using the in-process result cache")
+        return cls(
+            max_entries=int(os.getenv('RESULT_CACHE_SIZE', 1000)),
+            ttl=int(os.getenv('RESULT_CACHE_TTL', 300)),
+            redis_client=redis_client
+        )
+
+    def get(self, key):
+        """Return the cached response body for key, or None."""
+        body = self._get(key)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body
+
+    def _get(self, key):
+        if self.redis is not None:
+            try:
+                value = self.redis.get(self.redis_prefix + key)
+                return json.loads(value) if value else None
+            except Exception as e:
+                logging.warning("Result cache read failed: %s", e)
+                return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, body):
+        if self.redis is not None:
+            try:
+                self.redis.set(self.redis_prefix + key, json.dumps(body, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                logging.warning("Result cache write failed: %s", e)
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'shared': self.redis is not None}
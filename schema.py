@@ -0,0 +1,138 @@
+"""Index enforcement and the one-shot ID normalization migration.
+
+    python schema.py                 # ensure indexes
+    python schema.py --migrate       # convert string IDs to ints, then ensure indexes
+
+ensure_indexes() is called by app startup and the import scripts. The
+migration is batched and resumable: converted documents no longer match its
+query, so an interrupted run simply continues where it stopped.
+"""
+from pymongo import MongoClient, UpdateOne, DeleteOne
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+import argparse
+import logging
+import os
+import sys
+import certifi
+
+# Unique indexes as (collection, field, index name)
+UNIQUE_INDEXES = [
+    ('products', 'product_id', 'product_id_unique'),
+    ('categorys', 'ID', 'ID_unique')
+]
+
+# Non-unique indexes as (collection, field, index name)
+INDEXES = [
+    ('products', 'subcategory_id', 'subcategory_id')  # fragments.py rebuilds labels per category
+]
+
+# Fields converted from string to int by the migration, per collection
+INT_FIELDS = {
+    'products': ['product_id', 'subcategory_id'],
+    'categorys': ['ID']
+}
+
+def ensure_unique_index(collection, field, name):
+    """Create a unique index on field if it is missing. Returns True on success."""
+    try:
+        collection.create_index(field, unique=True, name=name)
+        return True
+    except OperationFailure as e:
+        # Usually duplicates left over from mixed string/int IDs
+        logging.error("Could not create unique index %s on %s.%s: %s. "
+                      "Run `python schema.py --migrate` to normalize IDs first.", name, collection.name, field, e)
+        return False
+
+def has_string_ids(db):
+    """True if any product still stores its product_id as a string (the migration has not run)."""
+    return db.products.find_one({'product_id': {'$type': 'string'}}, {'_id': 1}) is not None
+
+def ensure_indexes(db):
+    """Ensure the indexes the caption lookups and label refreshes rely on.
+
+    Returns True if all unique indexes exist and no product_id is still a
+    string. A unique index is created even over string IDs when there are no
+    duplicates, but int lookups miss those products until the migration runs.
+    """
+    ok = True
+    for collection_name, field, name in UNIQUE_INDEXES:
+        ok = ensure_unique_index(db[collection_name], field, name) and ok
+    for collection_name, field, name in INDEXES:
+        db[collection_name].create_index(field, name=name)
+    if has_string_ids(db):
+        logging.error("Some products still store product_id as a string; lookups will also query the string form "
+                      "until `python schema.py --migrate` has converted them.")
+        ok = False
+    return ok
+
+def migrate_field(collection, field, batch_size=1000):
+    """Convert string values of field to int in batches. Returns (converted, removed, skipped).
+
+    When the string and int forms of a unique ID both exist, the string
+    duplicate is deleted. Values that are not numeric are left untouched.
+    """
+    unique = any(collection.name == name and field == unique_field for name, unique_field, _ in UNIQUE_INDEXES)
+    converted = removed = skipped = 0
+    last_id = None
+    while True:
+        query = {field: {'$type': 'string'}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(collection.find(query, {field: 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        values = {}
+        for doc in batch:
+            try:
+                values[doc['_id']] = int(doc[field])
+            except ValueError:
+                skipped += 1
+
+        existing = set()
+        if unique and values:
+            existing = {doc[field] for doc in collection.find({field: {'$in': list(set(values.values()))}}, {field: 1})}
+
+        operations = []
+        for object_id, value in values.items():
+            if value in existing:
+                operations.append(DeleteOne({'_id': object_id}))
+            else:
+                operations.append(UpdateOne({'_id': object_id}, {'$set': {field: value}}))
+                if unique:
+                    existing.add(value)
+        if operations:
+            result = collection.bulk_write(operations, ordered=False)
+            converted += result.modified_count
+            removed += result.deleted_count
+        logging.info(f"{collection.name}.{field}: {converted} converted, {removed} duplicates removed, {skipped} skipped")
+    return converted, removed, skipped
+
+def migrate_ids(db, batch_size=1000):
+    """Run the ID normalization migration over every collection in INT_FIELDS."""
+    for collection_name, fields in INT_FIELDS.items():
+        for field in fields:
+            migrate_field(db[collection_name], field, batch_size)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ensure indexes and normalize ID types.")
+    parser.add_argument('--migrate', action='store_true', help="convert string IDs to ints before ensuring indexes")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGODB_URI'), tlsCAFile=certifi.where())
+    try:
+        db = client[os.getenv('DB_NAME', 'products')]
+        if args.migrate:
+            migrate_ids(db, args.batch_size)
+        if ensure_indexes(db):
+            logging.info("All indexes are in place and every product_id is an int")
+    finally:
+        client.close()
+
+if __name__ == '__main__':
+    main()
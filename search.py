@@ -0,0 +1,206 @@
+"""In-memory product search behind the autocomplete on the index page.
+
+Editors often have a product code (251892M131008), a product ID or a brand and
+category rather than a URL. SearchIndex answers prefix queries over all of
+those from sorted arrays in memory, well under a millisecond per query.
+"""
+from functools import lru_cache
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+
+TOKEN_PATTERN = re.compile(r'[0-9a-z]+')
+SLUG_PATTERN = re.compile(r'[^0-9a-z]+')
+
+# Summary fields kept per product and fetched when building
+SEARCH_FIELDS = ['product_id', 'product_code', 'brand', 'subcategory']
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text or '').lower())
+
+
+@lru_cache(maxsize=65536)
+def _name_tokens(text):
+    # Brands and subcategories repeat across many products; tokenize each once
+    return tuple(tokenize(text))
+
+
+def _slug(text):
+    return SLUG_PATTERN.sub('-', str(text or '').lower()).strip('-')
+
+
+def product_url(product):
+    """Canonical en-us URL for a product: the gender is the M/F at index 6 of the product code."""
+    code = product.get('product_code') or ''
+    gender = 'women' if code[6:7] == 'F' else 'men'
+    return (f"https://www.ssense.com/en-us/{gender}/product/{_slug(product.get('brand'))}/"
+            f"{_slug(product.get('subcategory'))}/{product['product_id']}")
+
+
+class SearchIndex:
+    """Prefix search over product_code, product_id and brand/subcategory tokens.
+
+    Distinct tokens are kept in one sorted list, each with the IDs of the
+    products that have it, so a query is a bisect to its prefix plus a short
+    scan. Multi-word queries match products having every word as a prefix of
+    one of their tokens. Results come in token order, so an exact code or ID
+    comes before longer ones. update() and remove() patch single products in
+    place; large changes are cheaper to rebuild with a new index.
+    """
+
+    def __init__(self, products=(), version=None):
+        self.version = version
+        self._entries = {} # product_id -> (summary, tokens)
+        self._postings = {} # token -> [product_id, ...]
+        self._lock = threading.Lock()
+        for product in products:
+            entry = self._entry(product)
+            if entry:
+                product_id = entry[0]['product_id']
+                self._entries[product_id] = entry
+                for token in entry[1]:
+                    self._postings.setdefault(token, []).append(product_id)
+        self._tokens = sorted(self._postings)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry(product):
+        try:
+            product_id = int(product['product_id'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        summary = {field: product.get(field) for field in SEARCH_FIELDS}
+        summary['product_id'] = product_id
+        tokens = {str(product_id)}
+        if product.get('product_code'):
+            tokens.add(str(product['product_code']).lower())
+        tokens.update(_name_tokens(product.get('brand')))
+        tokens.update(_name_tokens(product.get('subcategory')))
+        return summary, tuple(tokens)
+
+    def update(self, product):
+        """Add or replace one product."""
+        entry = self._entry(product)
+        if entry is None:
+            return
+        product_id = entry[0]['product_id']
+        with self._lock:
+            self._remove(product_id)
+            self._entries[product_id] = entry
+            for token in entry[1]:
+                if token not in self._postings:
+                    bisect.insort(self._tokens, token)
+                    self._postings[token] = []
+                self._postings[token].append(product_id)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(int(product_id))
+
+    def _remove(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if not entry:
+            return
+        for token in entry[1]:
+            product_ids = self._postings.get(token)
+            if product_ids and product_id in product_ids:
+                product_ids.remove(product_id)
+                if not product_ids:
+                    del self._postings[token]
+                    del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def search(self, query, limit=10, max_scan=20000):
+        """Return up to limit product summaries matching query, each with its URL."""
+        words = tokenize(query)
+        if not words or limit <= 0:
+            return []
+        # Scan the most selective (longest) word's range; check the others per candidate
+        driver = max(words, key=len)
+        others = [word for word in words if word != driver]
+        matches = []
+        seen = set()
+        # update() and remove() change the lists in place from other threads; a scan is short, so hold the lock
+        with self._lock:
+            tokens = self._tokens
+            index = bisect.bisect_left(tokens, driver)
+            while index < len(tokens) and tokens[index].startswith(driver) and len(seen) < max_scan and len(matches) < limit:
+                for product_id in self._postings.get(tokens[index], ()):
+                    if product_id in seen:
+                        continue
+                    seen.add(product_id)
+                    summary, product_tokens = self._entries[product_id]
+                    if all(any(token.startswith(word) for token in product_tokens) for word in others):
+                        matches.append(summary)
+                        if len(matches) >= limit:
+                            break
+                index += 1
+        return [dict(summary, url=product_url(summary)) for summary in matches]
+
+
+class ProductSearch:
+    """Keeps a SearchIndex in step with a Catalog.
+
+    start() builds the index in a background thread; until the first build
+    finishes, searches return no results rather than waiting on it. After
+    that, a change in the catalog's products version (bumped by every import
+    or sync) rebuilds it in the background while the old index keeps
+    serving. With PRODUCT_CACHE_WATCH on, individual product changes are
+    applied as they happen. A failed build is retried after retry_after
+    seconds.
+    """
+
+    def __init__(self, catalog, retry_after=30):
+        self.catalog = catalog
+        self.retry_after = retry_after
+        self.index = None
+        self._building = None # pid of the process running a background build
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        catalog.change_listeners.append(self._on_change)
+
+    def build(self):
+        """Build the index in this thread, e.g. while preloading in a gunicorn master."""
+        version = self.catalog.products_version()
+        started = time.monotonic()
+        index = SearchIndex(self.catalog.iter_products(SEARCH_FIELDS), version)
+        logging.info("[Search] Indexed %d products in %.2fs", len(index), time.monotonic() - started)
+        self.index = index
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            logging.error("[Search] Index build failed: %s", e)
+            self._retry_at = time.monotonic() + self.retry_after
+        finally:
+            self._building = None
+
+    def start(self):
+        """Build the index in a background thread, unless this process is already building it."""
+        pid = os.getpid()
+        with self._lock:
+            # A build running when the process forked belongs to the parent; start our own
+            if self._building == pid or time.monotonic() < self._retry_at:
+                return
+            self._building = pid
+        threading.Thread(target=self._build_in_background, name='search-index-build', daemon=True).start()
+
+    def current(self):
+        """Return the index (None until the first build finishes), starting a rebuild when the catalog changes."""
+        if self.index is None or self.index.version != self.catalog.products_version():
+            self.start()
+        return self.index
+
+    def search(self, query, limit=10):
+        index = self.current()
+        return index.search(query, limit) if index is not None else []
+
+    def _on_change(self, product):
+        if self.index is not None:
+            self.index.update(product)
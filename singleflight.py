@@ -0,0 +1,130 @@
+"""Request coalescing: concurrent lookups of the same key share one in-flight fetch."""
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based single-flight group.
+
+    do_many(keys, fetch_many) fetches the keys no other thread is already
+    fetching with one fetch_many call, and waits for the rest. fetch_many
+    takes a list of keys and returns {key: value}; keys it leaves out resolve
+    to None.
+    """
+
+    def __init__(self):
+        self.fetches = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fetch):
+        """Run fetch() for key unless another thread already is; share its result."""
+        return self.do_many([key], lambda keys: {key: fetch()})[key]
+
+    def do_many(self, keys, fetch_many):
+        owned = {}
+        waiting = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    owned[key] = call
+                else:
+                    waiting[key] = call
+            if owned:
+                self.fetches += 1
+            self.coalesced += len(waiting)
+
+        results = {}
+        if owned:
+            try:
+                fetched = fetch_many(list(owned))
+                for key, call in owned.items():
+                    call.value = results[key] = fetched.get(key)
+            except BaseException as e:
+                for call in owned.values():
+                    call.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        del self._calls[key]
+                for call in owned.values():
+                    call.done.set()
+
+        for key, call in waiting.items():
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            results[key] = call.value
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {'fetches': self.fetches, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight for coroutines on one event loop."""
+
+    def __init__(self):
+        self.fetches = 0
+        self.coalesced = 0
+        self._futures = {}
+
+    async def do(self, key, fetch):
+        """Await fetch() for key unless it is already in flight; share its result."""
+        return (await self.do_many([key], lambda keys: _single(key, fetch)))[key]
+
+    async def do_many(self, keys, fetch_many):
+        loop = asyncio.get_running_loop()
+        owned = {}
+        waiting = {}
+        for key in dict.fromkeys(keys):
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = loop.create_future()
+                owned[key] = future
+            else:
+                waiting[key] = future
+        if owned:
+            self.fetches += 1
+        self.coalesced += len(waiting)
+
+        results = {}
+        if owned:
+            try:
+                fetched = await fetch_many(list(owned))
+                for key, future in owned.items():
+                    results[key] = fetched.get(key)
+                    future.set_result(results[key])
+            except BaseException as e:
+                for future in owned.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        # Mark retrieved so an unawaited failure doesn't log a warning
+                        future.exception()
+                raise
+            finally:
+                for key in owned:
+                    del self._futures[key]
+
+        for key, future in waiting.items():
+            results[key] = await future
+        return results
+
+    def stats(self):
+        return {'fetches': self.fetches, 'coalesced': self.coalesced, 'in_flight': len(self._futures)}
+
+
+async def _single(key, fetch):
+    return {key: await fetch()}
@@ -0,0 +1,211 @@
+"""Offline catalog snapshot: a memory-mapped product index keyed by product_id.
+
+Build a snapshot from MongoDB or from products.txt (JSONL):
+
+    python snapshot.py --mongo --output catalog.snap
+    python snapshot.py --products products.txt --categories categories.jsonl --output catalog.snap
+
+Run the app from it with CATALOG_BACKEND=snapshot (and CATALOG_SNAPSHOT=<path>).
+
+File layout (little-endian):
+    header   magic, slot count, product count, build time, categories offset/length, slots offset
+    slots    open-addressing hash table of (product_id + 1, record offset, record length)
+    records  compact JSON product documents
+    categories  JSON list of category documents
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+from catalog import MAX_PRODUCT_ID
+
+MAGIC = b'SSCATv1\x00'
+HEADER = struct.Struct('<8sIIQQQQ')
+SLOT = struct.Struct('<QQI')
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Product fields kept in the snapshot
+PRODUCT_FIELDS = ['product_id', 'product_code', 'brand', 'subcategory_id', 'subcategory', 'caption_labels']
+
+
+def _slot_index(key, bits):
+    """Fibonacci hash of key into a table of 2**bits slots."""
+    return ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - bits)
+
+
+def _normalize_product(product):
+    """Return the snapshot record for a product, or None if its ID is not numeric or out of range."""
+    try:
+        record = {field: product[field] for field in PRODUCT_FIELDS if field in product}
+        record['product_id'] = int(record['product_id'])
+        # Slot keys are unsigned 8-byte product_id + 1; MongoDB IDs are signed 8-byte ints anyway
+        if not 0 <= record['product_id'] <= MAX_PRODUCT_ID:
+            return None
+        if 'subcategory_id' in record:
+            record['subcategory_id'] = int(record['subcategory_id'])
+        return record
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def write_snapshot(path, products, categories):
+    """Write products and categories to a snapshot file at path, atomically."""
+    records = {}
+    skipped = 0
+    for product in products:
+        record = _normalize_product(product)
+        if record is None:
+            skipped += 1
+            continue
+        records[record['product_id']] = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if skipped:
+        logging.warning("Skipped %d products without a valid product_id", skipped)
+
+    # Keep the table at most half full so probes stay short
+    bits = max(4, (2 * len(records) - 1).bit_length())
+    slot_count = 1 << bits
+    slots_offset = HEADER.size
+    data_offset = slots_offset + slot_count * SLOT.size
+
+    slots = bytearray(slot_count * SLOT.size)
+    offset = data_offset
+    for product_id, record in records.items():
+        key = product_id + 1 # 0 marks an empty slot
+        index = _slot_index(key, bits)
+        while SLOT.unpack_from(slots, index * SLOT.size)[0]:
+            index = (index + 1) & (slot_count - 1)
+        SLOT.pack_into(slots, index * SLOT.size, key, offset, len(record))
+        offset += len(record)
+
+    category_docs = []
+    for category in categories:
+        category = {key: value for key, value in category.items() if key != '_id'}
+        category_docs.append(category)
+    category_blob = json.dumps(category_docs, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, slot_count, len(records), int(time.time()), offset, len(category_blob), slots_offset))
+        f.write(slots)
+        for record in records.values():
+            f.write(record)
+        f.write(category_blob)
+    os.replace(tmp_path, path)
+    logging.info(f"Wrote snapshot {path}: {len(records)} products, {len(category_docs)} categories")
+    return len(records)
+
+
+class CatalogSnapshot:
+    """Read-only, memory-mapped view of a snapshot file.
+
+    The file is mapped rather than read, so every worker process on the host
+    shares the same page-cache pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.slot_count, self.product_count, self.built_at,
+         self._categories_offset, self._categories_length, self._slots_offset) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self._bits = self.slot_count.bit_length() - 1
+        self.version = f"snapshot-{self.built_at}"
+        logging.info(f"Opened catalog snapshot {path} with {self.product_count} products")
+
+    def get(self, product_id):
+        """Return the product document for product_id, or None."""
+        try:
+            key = int(product_id) + 1
+        except (TypeError, ValueError):
+            return None
+        index = _slot_index(key, self._bits)
+        while True:
+            slot_key, offset, length = SLOT.unpack_from(self._mmap, self._slots_offset + index * SLOT.size)
+            if slot_key == key:
+                return json.loads(self._mmap[offset:offset + length])
+            if slot_key == 0:
+                return None
+            index = (index + 1) & (self.slot_count - 1)
+
+    def lookup_products(self, product_ids):
+        """Return (found, missing) with the same contract as catalog.lookup_products."""
+        found = {}
+        missing = []
+        for product_id in dict.fromkeys(str(product_id) for product_id in product_ids):
+            product = self.get(product_id)
+            if product is not None:
+                found[product_id] = product
+            else:
+                missing.append(product_id)
+        return found, missing
+
+    def iter_products(self):
+        """Yield every product document in the snapshot, in slot order."""
+        for index in range(self.slot_count):
+            slot_key, offset, length = SLOT.unpack_from(self._mmap, self._slots_offset + index * SLOT.size)
+            if slot_key:
+                yield json.loads(self._mmap[offset:offset + length])
+
+    def load_categories(self):
+        """Return the list of category documents stored in the snapshot."""
+        start = self._categories_offset
+        return json.loads(self._mmap[start:start + self._categories_length])
+
+    def close(self):
+        self._mmap.close()
+
+
+def read_jsonl(path):
+    """Yield one JSON document per non-empty line of path."""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip().rstrip(',')
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning("Skipping unparseable line in %s: %s", path, e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a memory-mapped catalog snapshot.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--mongo', action='store_true', help="read products and categorys from MONGODB_URI")
+    source.add_argument('--products', help="read products from a JSONL file such as products.txt")
+    parser.add_argument('--categories', help="JSONL file of category documents (with --products)")
+    parser.add_argument('--output', default=os.getenv('CATALOG_SNAPSHOT', 'catalog.snap'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    started = time.monotonic()
+
+    if args.mongo:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+        import certifi
+
+        load_dotenv()
+        client = MongoClient(os.getenv('MONGODB_URI'), tlsCAFile=certifi.where())
+        try:
+            db = client[os.getenv('DB_NAME', 'products')]
+            projection = {field: 1 for field in PRODUCT_FIELDS}
+            write_snapshot(args.output, db.products.find({}, projection), db.categorys.find({}))
+        finally:
+            client.close()
+    else:
+        categories = read_jsonl(args.categories) if args.categories else []
+        write_snapshot(args.output, read_jsonl(args.products), categories)
+
+    logging.info(f"Snapshot built in {time.monotonic() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Incremental catalog sync: apply only the products that changed since the last run.
+
+    python sync_catalog.py --file products.txt
+    python sync_catalog.py --file products.txt --atomic
+
+A checkpoint file keeps a content hash per product_id. Each run upserts the
+products whose hash is new or different and deletes the products that are no
+longer in the feed, instead of clearing and re-inserting the collection.
+
+By default the changes are applied to the live collection, upserts first, so
+the catalog is never empty. With --atomic they are applied to a server-side
+copy of the collection that is then swapped in with renameCollection, so
+readers see either the old catalog or the new one and never a partial sync.
+"""
+from pymongo import MongoClient
+from dotenv import load_dotenv
+import argparse
+import hashlib
+import json
+import os
+import certifi
+import time
+
+from import_products import iter_product_chunks, upsert_products
+from catalog import bump_catalog_version
+from fragments import refresh_labels
+from logging_setup import configure_logging
+from schema import UNIQUE_INDEXES, ensure_indexes, ensure_unique_index
+
+# Load environment variables
+load_dotenv()
+
+STAGING_SUFFIX = '_staging'
+
+def product_hash(product):
+    """Stable content hash of a normalized product document."""
+    canonical = json.dumps(product, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def load_checkpoint(path):
+    """Return {product_id: hash} from the checkpoint file, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return {int(product_id): digest for product_id, digest in json.load(file).items()}
+
+def save_checkpoint(path, hashes):
+    """Write the checkpoint atomically so a crash never leaves a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({str(product_id): digest for product_id, digest in hashes.items()}, file)
+    os.replace(tmp_path, path)
+
+def existing_product_ids(collection):
+    """Return the set of product IDs currently stored, used when there is no checkpoint yet."""
+    product_ids = set()
+    for doc in collection.find({}, {'_id': 0, 'product_id': 1}):
+        try:
+            product_ids.add(int(doc['product_id']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return product_ids
+
+def prepare_staging(db, collection_name):
+    """Copy the live collection to a staging collection server-side and return it."""
+    staging_name = f"{collection_name}{STAGING_SUFFIX}"
+    db[staging_name].drop()
+    db[collection_name].aggregate([{'$match': {}}, {'$out': staging_name}])
+    staging = db[staging_name]
+    # $out does not copy indexes; create them before the rename swaps staging in
+    for name, field, index_name in UNIQUE_INDEXES:
+        if name == collection_name:
+            ensure_unique_index(staging, field, index_name)
+    return staging
+
+def swap_in_staging(db, collection_name):
+    """Atomically replace the live collection with its staging copy."""
+    db.client.admin.command(
+        'renameCollection', f"{db.name}.{collection_name}{STAGING_SUFFIX}",
+        to=f"{db.name}.{collection_name}", dropTarget=True
+    )
+
+def sync_catalog(db, file_path, checkpoint_path, collection_name='products', batch_size=1000, workers=1, atomic=False):
+    """Apply the difference between file_path and the last checkpoint. Returns a dict of totals."""
+    started = time.monotonic()
+    live = db[collection_name]
+    previous = load_checkpoint(checkpoint_path)
+    if previous is None:
+        print("No checkpoint found; every product in the feed will be upserted")
+        previous = dict.fromkeys(existing_product_ids(live))
+
+    target = prepare_staging(db, collection_name) if atomic else live
+    totals = {'added': 0, 'changed': 0, 'unchanged': 0, 'deleted': 0, 'errors': 0, 'upserted_ids': []}
+    hashes = {}
+
+    for products, errors in iter_product_chunks(file_path, batch_size, workers):
+        totals['errors'] += errors
+        changed = []
+        for product in products:
+            product_id = product['product_id']
+            digest = product_hash(product)
+            hashes[product_id] = digest
+            if product_id not in previous:
+                totals['added'] += 1
+                changed.append(product)
+            elif previous[product_id] != digest:
+                totals['changed'] += 1
+                changed.append(product)
+            else:
+                totals['unchanged'] += 1
+        if changed:
+            upsert_products(target, changed)
+            totals['upserted_ids'].extend(product['product_id'] for product in changed)
+        print(f"Scanned {len(hashes)} products: {totals['added']} added, {totals['changed']} changed, {totals['unchanged']} unchanged")
+
+    # Delete what is gone only after every upsert has been applied
+    removed = [product_id for product_id in previous if product_id not in hashes]
+    for start in range(0, len(removed), batch_size):
+        chunk = removed[start:start + batch_size]
+        result = target.delete_many({'product_id': {'$in': chunk + [str(product_id) for product_id in chunk]}})
+        totals['deleted'] += result.deleted_count
+
+    if atomic:
+        swap_in_staging(db, collection_name)
+        print(f"Swapped {collection_name}{STAGING_SUFFIX} into {collection_name}")
+
+    save_checkpoint(checkpoint_path, hashes)
+    totals['seconds'] = time.monotonic() - started
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally sync a JSONL product feed into MongoDB.")
+    parser.add_argument('--file', default='products.txt', help="JSONL product file")
+    parser.add_argument('--checkpoint', default='catalog_sync.json', help="per-product hash checkpoint")
+    parser.add_argument('--batch-size', type=int, default=1000, help="products per bulk write")
+    parser.add_argument('--workers', type=int, default=1, help="parser processes")
+    parser.add_argument('--atomic', action='store_true', help="apply to a staging copy and swap it in")
+    args = parser.parse_args()
+
+    configure_logging()
+    client = None
+    try:
+        # Connect to MongoDB
+        print("Connecting to MongoDB...")
+        client = MongoClient(os.getenv('MONGODB_URI'), tlsCAFile=certifi.where())
+        db = client[os.getenv('DB_NAME', 'products')]
+
+        # Index product_id first so each upsert's lookup doesn't scan the collection
+        ensure_indexes(db)
+        totals = sync_catalog(db, args.file, args.checkpoint, batch_size=args.batch_size, workers=args.workers, atomic=args.atomic)
+        if args.atomic:
+            # The swapped-in staging copy only has the unique indexes
+            ensure_indexes(db)
+        bump_catalog_version(db)
+        # Labels for the products just written, then for any category whose translations changed
+        labels = refresh_labels(db, product_ids=totals['upserted_ids'], batch_size=args.batch_size)
+        category_labels = refresh_labels(db, batch_size=args.batch_size)
+        print(f"Refreshed caption labels on {labels['updated'] + category_labels['updated']} products")
+        print(f"Sync finished in {totals['seconds']:.1f}s: {totals['added']} added, {totals['changed']} changed, "
+              f"{totals['deleted']} deleted, {totals['unchanged']} unchanged, {totals['errors']} errors")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if client:
+            client.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""ProductFetcher against a local HTTP stand-in serving the fixture pages.
+
+    python -m pytest tests/
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import Catalog
+from fetcher import ProductFetcher, new_session
+from snapshot import write_snapshot
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Product page paths served by the stand-in, and the fixture each one returns
+PAGES = {
+    '/en-us/men/product/martine-rose/belts-suspenders/90000001': 'product_jsonld.html',
+    '/en-us/men/product/kijun/tank-tops/90000002': 'product_breadcrumb.html',
+    '/en-us/women/product/unknown/flat-sandals/90000003': 'product_no_brand.html'
+}
+
+CATEGORIES = [
+    {'ID': 131, 'EN Category': 'BELTS & SUSPENDERS', 'FR Category': 'CEINTURES ET BRETELLES', 'JP Category': 'ベルト＆サスペンダー', 'ZH Category': '腰带和背带'},
+    {'ID': 214, 'EN Category': 'TANK TOPS', 'FR Category': 'DÉBARDEURS', 'JP Category': 'タンクトップ', 'ZH Category': '背心'},
+    {'ID': 124, 'EN Category': 'FLAT SANDALS', 'FR Category': 'SANDALES PLATES', 'JP Category': 'フラットサンダル', 'ZH Category': '平底凉鞋'}
+]
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requested.append(self.path)
+        name = PAGES.get(self.path)
+        if name is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        with open(os.path.join(FIXTURES, name), 'rb') as file:
+            body = file.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def product_url(path):
+    return 'https://www.ssense.com' + path
+
+
+class ProductFetcherTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        cls.server.requested = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.server.requested.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'catalog.snap')
+        write_snapshot(path, [], CATEGORIES)
+        self.catalog = Catalog(backend='snapshot', snapshot_path=path)
+        self.fetcher = ProductFetcher(self.catalog, session=new_session(4), base_url=self.base_url,
+                                      rate=50, burst=10, concurrency=4, timeout=5, deadline=5)
+
+    def tearDown(self):
+        self.catalog.snapshot.close()
+        self.directory.cleanup()
+
+    def test_resolves_json_ld_page(self):
+        path = '/en-us/men/product/martine-rose/belts-suspenders/90000001'
+        resolved = self.fetcher.resolve({'90000001': product_url(path) + '?color=black'})
+
+        doc = resolved['90000001']
+        self.assertEqual(doc['product_id'], 90000001)
+        self.assertEqual(doc['brand'], 'Martine Rose')
+        self.assertEqual(doc['subcategory_id'], 131)
+        self.assertEqual(doc['subcategory'], 'BELTS & SUSPENDERS')
+        self.assertEqual(doc['product_code'], '252892M131001')
+        self.assertEqual(doc['source'], 'fallback')
+        # Fetched from base_url with the pasted path, query dropped
+        self.assertEqual(self.server.requested, [path])
+
+    def test_resolves_breadcrumb_page_with_meta_brand(self):
+        path = '/en-us/men/product/kijun/tank-tops/90000002'
+        doc = self.fetcher.resolve({'90000002': product_url(path)})['90000002']
+
+        self.assertEqual(doc['brand'], 'Kijun')
+        self.assertEqual(doc['subcategory_id'], 214)
+        self.assertEqual(doc['subcategory'], 'TANK TOPS')
+        self.assertNotIn('product_code', doc)
+
+    def test_resolved_products_are_cached(self):
+        urls = {
+            '90000001': product_url('/en-us/men/product/martine-rose/belts-suspenders/90000001'),
+            '90000002': product_url('/en-us/men/product/kijun/tank-tops/90000002')
+        }
+        self.assertEqual(set(self.fetcher.resolve(urls)), {'90000001', '90000002'})
+
+        found, missing = self.catalog.product_cache.get_many(['90000001', '90000002'])
+        self.assertEqual(missing, [])
+        self.assertEqual(found['90000002']['brand'], 'Kijun')
+        self.assertEqual(self.fetcher.stats()['resolved'], 2)
+
+    def test_page_without_brand_is_not_resolved_or_retried(self):
+        url = product_url('/en-us/women/product/unknown/flat-sandals/90000003')
+        self.assertEqual(self.fetcher.resolve({'90000003': url}), {})
+        self.assertEqual(self.fetcher.resolve({'90000003': url}), {})
+
+        self.assertEqual(len(self.server.requested), 1)
+        self.assertEqual(self.fetcher.stats()['failed'], 1)
+        self.assertEqual(self.fetcher.stats()['backing_off'], 1)
+
+    def test_missing_page_is_not_resolved(self):
+        url = product_url('/en-us/men/product/gone/t-shirts/90000004')
+        self.assertEqual(self.fetcher.resolve({'90000004': url}), {})
+        _, missing = self.catalog.product_cache.get_many(['90000004'])
+        self.assertEqual(missing, ['90000004'])
+
+    def test_pass_is_capped(self):
+        self.fetcher.max_per_pass = 1
+        resolved = self.fetcher.resolve({
+            '90000001': product_url('/en-us/men/product/martine-rose/belts-suspenders/90000001'),
+            '90000002': product_url('/en-us/men/product/kijun/tank-tops/90000002')
+        })
+        self.assertEqual(list(resolved), ['90000001'])
+        self.assertEqual(len(self.server.requested), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()